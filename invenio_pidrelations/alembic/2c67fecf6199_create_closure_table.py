@@ -0,0 +1,72 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Create closure table."""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = '2c67fecf6199'
+down_revision = 'b04d820b50fc'
+branch_labels = ()
+depends_on = None
+
+
+def upgrade():
+    """Upgrade database."""
+    op.create_table(
+        'pidrelations_closure',
+        sa.Column('ancestor_id', sa.Integer(), nullable=False),
+        sa.Column('descendant_id', sa.Integer(), nullable=False),
+        sa.Column('relation_type', sa.SmallInteger(), nullable=False),
+        sa.Column('depth', sa.Integer(), nullable=False),
+        sa.Column('paths', sa.Integer(), nullable=False),
+        sa.ForeignKeyConstraint(
+            ['ancestor_id'], [u'pidstore_pid.id'],
+            name=op.f('fk_pidrelations_closure_ancestor_id_pidstore_pid'),
+            onupdate='CASCADE', ondelete='CASCADE'
+        ),
+        sa.ForeignKeyConstraint(
+            ['descendant_id'], [u'pidstore_pid.id'],
+            name=op.f('fk_pidrelations_closure_descendant_id_pidstore_pid'),
+            onupdate='CASCADE', ondelete='CASCADE'
+        ),
+        sa.PrimaryKeyConstraint(
+            'ancestor_id', 'descendant_id', 'relation_type', 'depth',
+            name=op.f('pk_pidrelations_closure')
+        )
+    )
+    op.create_index(
+        'idx_pidrelations_closure_descendant_type',
+        'pidrelations_closure', ['descendant_id', 'relation_type'],
+        unique=False
+    )
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_index('idx_pidrelations_closure_descendant_type',
+                  table_name='pidrelations_closure')
+    op.drop_table('pidrelations_closure')
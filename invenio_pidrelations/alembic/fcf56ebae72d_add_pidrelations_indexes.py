@@ -0,0 +1,54 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Add indexes for child-side and ordered relation lookups."""
+
+import sqlalchemy as sa
+from alembic import op
+
+# revision identifiers, used by Alembic.
+revision = 'fcf56ebae72d'
+down_revision = '7e9821fe9f8f'
+branch_labels = ()
+depends_on = None
+
+
+def upgrade():
+    """Upgrade database."""
+    op.create_index(
+        'idx_pidrelations_child_type', 'pidrelations_pidrelation',
+        ['child_id', 'relation_type'], unique=False
+    )
+    op.create_index(
+        'idx_pidrelations_parent_type_index', 'pidrelations_pidrelation',
+        ['parent_id', 'relation_type', 'index'], unique=False
+    )
+
+
+def downgrade():
+    """Downgrade database."""
+    op.drop_index('idx_pidrelations_parent_type_index',
+                  table_name='pidrelations_pidrelation')
+    op.drop_index('idx_pidrelations_child_type',
+                  table_name='pidrelations_pidrelation')
@@ -26,17 +26,90 @@
 
 from __future__ import absolute_import, print_function
 
+from collections import namedtuple
+
+from flask import current_app
 from invenio_db import db
 from invenio_pidstore.models import PersistentIdentifier
+from sqlalchemy import and_, case, event, func, literal, or_, select
 from sqlalchemy.exc import IntegrityError
+from sqlalchemy.orm import Session, aliased, joinedload, object_session
+from sqlalchemy.orm.attributes import flag_modified
+from sqlalchemy.orm.exc import MultipleResultsFound
 
-from .models import PIDRelation
+from .cache import clear_concept_cache, concept_cache
+from .closure import closure_relation_types
+from .locks import ConceptConflictError, lock_concept, retry_on_conflict
+from .models import PIDConceptHead, PIDRelation, PIDRelationClosure
 from .utils import resolve_relation_type_config
 
 
+class PrefetchedChildren(list):
+    """List of prefetched children supporting the common query methods."""
+
+    def all(self):
+        """Return all the children."""
+        return list(self)
+
+    def count(self):
+        """Return the number of children."""
+        return len(self)
+
+    def first(self):
+        """Return the first child or None."""
+        return self[0] if self else None
+
+    def one_or_none(self):
+        """Return the only child or None."""
+        if len(self) > 1:
+            raise MultipleResultsFound(
+                "Multiple rows were found for one_or_none()")
+        return self.first()
+
+
+ChildrenPage = namedtuple('ChildrenPage', ['children', 'after'])
+"""Page of children of a concept.
+
+``after`` is the cursor of the next page, or None for the last page.
+"""
+
+Neighbourhood = namedtuple('Neighbourhood', [
+    'is_ordered', 'index', 'previous', 'next', 'is_last', 'children_count'])
+"""Position of a child among its siblings (see
+:meth:`PIDConcept.neighbourhood`)."""
+
+ChildrenWindow = namedtuple('ChildrenWindow',
+                            ['children', 'first', 'last', 'count'])
+"""Window of children around a child (see :meth:`PIDConcept.children_window`).
+"""
+
+PIDRecord = namedtuple('PIDRecord', [
+    'id', 'pid_type', 'pid_value', 'status', 'object_uuid', 'index'])
+"""Read-only PID of a relation, with the position of the child.
+
+Returned by the ``*_records`` methods of :class:`PIDConcept`, which read the
+PIDs with plain SQL statements instead of loading them in the session.
+
+The ``index`` is the position of the child among the ordered children of the
+parent, starting from 0. Unlike the stored index of the relation, it is dense
+even with sparse ordering (see :attr:`PIDConcept.index_gap`), and it is None
+for the unordered children.
+"""
+
+
 class PIDConcept(object):
     """API for PID version relations."""
 
+    relation_type_name = None
+    """Name of the relation type the API is bound to (if any)."""
+
+    _prefetched = None
+    """Prefetched (relation, child) pairs of the parent, sorted by index."""
+
+    _relation = _missing = object()
+    """Relation of the child, loaded on first access (see :attr:`relation`).
+    """
+
     def __init__(self, child=None, parent=None, relation_type=None,
                  relation=None):
         """Create a PID concept API object."""
@@ -55,11 +128,40 @@ class PIDConcept(object):
             # NOTE: Do not query.filter(...) with partial information
             # as you might guess wrong if the relation does not exist
 
+    @property
+    def relation(self):
+        """Relation of the child to its parent, or None.
+
+        APIs bound to a relation type (see ``relation_type_name``) allow a
+        single parent per child: the relation is then queried on first access,
+        together with the parent. Other APIs only know the relation they were
+        created with.
+        """
+        if self._relation is self._missing:
+            self._relation = self._load_relation()
+        return self._relation
+
+    @relation.setter
+    def relation(self, relation):
+        self._relation = relation
+
+    def _load_relation(self):
+        """Query the relation of the child, with its parent."""
+        if self.child is None or self.relation_type_name is None or \
+                self._prefetched is not None:
+            return None
+        return PIDRelation.query.options(
+            joinedload(PIDRelation.parent)
+        ).filter(
+            PIDRelation.child_id == self.child.id,
+            PIDRelation.relation_type == self.relation_type,
+        ).one_or_none()
+
     @property
     def parents(self):
         """Return the PID parents for given relation."""
         filter_cond = [PIDRelation.child_id == self.child.id, ]
-        if self.relation_type:
+        if self.relation_type is not None:
             filter_cond.append(PIDRelation.relation_type == self.relation_type)
         return db.session.query(PersistentIdentifier).join(
             PIDRelation,
@@ -69,12 +171,19 @@ class PIDConcept(object):
     @property
     def is_ordered(self):
         """Determine if the concept is an ordered concept."""
+        if self._prefetched is not None:
+            # NOTE: Same result as the query below, whose rows are never None
+            return True
         return all(val is not None for val in self.children.with_entities(
             PIDRelation.index))
 
     @property
     def has_parents(self):
         """Determine if there are any parents in this relationship."""
+        if self._prefetched is not None or (
+                self.relation_type_name is not None and
+                self.child is not None):
+            return self.parent is not None
         return self.parents.count() > 0
 
     @property
@@ -87,9 +196,11 @@ class PIDConcept(object):
         None if not found
         Raises 'sqlalchemy.orm.exc.MultipleResultsFound' for multiple parents.
         """
-        if self._parent is None:
-            parent = self.parents.one_or_none()
-            self._parent = parent
+        if self._parent is None and self._prefetched is None:
+            if self.relation_type_name is not None and self.child is not None:
+                self._parent = self.relation.parent if self.relation else None
+            else:
+                self._parent = self.parents.one_or_none()
         return self._parent
 
     @parent.setter
@@ -103,10 +214,14 @@ class PIDConcept(object):
 
     def get_children(self, ordered=False, pid_status=None):
         """Get all children of the parent."""
+        if self._prefetched is not None:
+            return PrefetchedChildren(
+                pid for relation, pid in self._prefetched
+                if pid_status is None or pid.status == pid_status)
         filter_cond = [PIDRelation.parent_id == self.parent.id, ]
         if pid_status is not None:
             filter_cond.append(PersistentIdentifier.status == pid_status)
-        if self.relation_type:
+        if self.relation_type is not None:
             filter_cond.append(PIDRelation.relation_type == self.relation_type)
 
         q = db.session.query(PersistentIdentifier).join(
@@ -118,9 +233,28 @@ class PIDConcept(object):
         else:
             return q
 
+    @property
+    def index_gap(self):
+        """Gap between the stored indices of the children (sparse ordering).
+
+        None if the children of the relation are stored with dense indices.
+        """
+        if self.relation_type is None:
+            return None
+        name = resolve_relation_type_config(self.relation_type).name
+        return current_app.config['PIDRELATIONS_INDEX_GAPS'].get(name)
+
     @property
     def index(self):
         """Index of the child in the relation."""
+        if self.relation.index is not None and self.index_gap:
+            if self._prefetched is not None:
+                return len([r for r, pid in self._prefetched
+                            if r.index < self.relation.index])
+            return PIDRelation.query.filter(
+                PIDRelation.parent_id == self.relation.parent_id,
+                PIDRelation.relation_type == self.relation_type,
+                PIDRelation.index < self.relation.index).count()
         return self.relation.index
 
     @property
@@ -128,10 +262,272 @@ class PIDConcept(object):
         """Children of the parent."""
         return self.get_children()
 
+    def children_page(self, after=None, limit=100):
+        """Get a page of the children of the parent.
+
+        Pages are fetched with keyset pagination on ``(index, child_id)``,
+        so that fetching a page does not depend on the number of children
+        before it. Children without an index come last, ordered by id.
+
+        :param after: Cursor of the page, as returned with the previous page
+            (None for the first page).
+        :param limit: Maximum number of children in the page.
+        :returns: A :class:`ChildrenPage`.
+        """
+        if self._prefetched is not None:
+            return self._prefetched_children_page(after, limit)
+        query = self.children.order_by(None).add_columns(
+            PIDRelation.index, PIDRelation.child_id)
+        rows = []
+        if after is None or after[0] is not None:
+            q = query.filter(PIDRelation.index.isnot(None))
+            if after is not None:
+                index, child_id = after
+                q = q.filter(or_(
+                    PIDRelation.index > index,
+                    and_(PIDRelation.index == index,
+                         PIDRelation.child_id > child_id)))
+            rows = q.order_by(
+                PIDRelation.index, PIDRelation.child_id).limit(limit).all()
+        if len(rows) < limit:
+            q = query.filter(PIDRelation.index.is_(None))
+            if after is not None and after[0] is None:
+                q = q.filter(PIDRelation.child_id > after[1])
+            rows += q.order_by(
+                PIDRelation.child_id).limit(limit - len(rows)).all()
+        after = (rows[-1][1], rows[-1][2]) if len(rows) == limit else None
+        return ChildrenPage([r[0] for r in rows], after)
+
+    def _prefetched_children_page(self, after, limit):
+        """Get a page of the prefetched children."""
+        children = set(self.children)
+        keys = [((r.index is None, r.index, r.child_id), pid)
+                for r, pid in self._prefetched if pid in children]
+        if after is not None:
+            cursor = (after[0] is None, after[0], after[1])
+            keys = [(key, pid) for key, pid in keys if key > cursor]
+        keys = keys[:limit]
+        after = keys[-1][0][1:] if len(keys) == limit else None
+        return ChildrenPage([pid for key, pid in keys], after)
+
+    def iter_children(self, batch_size=1000):
+        """Iterate over the children of the parent, one page at a time.
+
+        Only one page of children is loaded at once (see
+        :meth:`children_page`).
+
+        :param batch_size: Number of children fetched per query.
+        """
+        after = None
+        while True:
+            page = self.children_page(after=after, limit=batch_size)
+            for child in page.children:
+                yield child
+            if page.after is None:
+                break
+            after = page.after
+
+    def children_window(self, size):
+        """Get the children around the child, with the first and the last.
+
+        Children are ordered as in :meth:`children_page`. If the PID is not
+        one of the children, e.g. it is the parent or a draft version, the
+        window is taken at the end of the children.
+
+        :param size: Maximum number of children before and after the PID.
+        :returns: A :class:`ChildrenWindow`.
+        """
+        if self._prefetched is not None:
+            children = self.children.all()
+            rows = [(pid, pos, len(children))
+                    for pos, pid in enumerate(children, 1)]
+        else:
+            order = (PIDRelation.index.is_(None), PIDRelation.index,
+                     PIDRelation.child_id)
+            children = self.children.order_by(None).add_columns(
+                func.row_number().over(order_by=order).label('position'),
+                func.count().over().label('count'),
+            ).cte('children')
+            pid = aliased(PersistentIdentifier, children)
+            center = db.session.query(children.c.position).filter(
+                children.c.id == (self.child.id if self.child else None)
+            ).as_scalar()
+            center = func.coalesce(center, children.c.count - size)
+            rows = db.session.query(
+                pid, children.c.position, children.c.count
+            ).filter(or_(
+                children.c.position == 1,
+                children.c.position == children.c.count,
+                children.c.position.between(center - size, center + size),
+            )).order_by(children.c.position).all()
+        if not rows:
+            return ChildrenWindow([], None, None, 0)
+
+        count = rows[0][2]
+        center = next((pos for pid, pos, c in rows if pid == self.child),
+                      count - size)
+        return ChildrenWindow(
+            children=[pid for pid, pos, c in rows
+                      if abs(pos - center) <= size],
+            first=rows[0][0],
+            last=rows[-1][0],
+            count=count,
+        )
+
+    @staticmethod
+    def _positioned_relations(*filters):
+        """Select the relations with the dense position of their index.
+
+        The positions are numbered over all the relations of a parent and
+        type, thus the filters should select all of them, e.g. by parent.
+        """
+        relations = PIDRelation.__table__
+        position = func.row_number().over(
+            partition_by=(relations.c.parent_id, relations.c.relation_type),
+            order_by=(relations.c.index.is_(None), relations.c.index),
+        ) - 1
+        return select([relations, case(
+            [(relations.c.index.isnot(None), position)]).label('position')]
+        ).where(and_(*filters)).alias('relations')
+
+    def _select_records(self, relations, onclause, *filters):
+        """Select the PIDs joined to their relations as :class:`PIDRecord`.
+
+        :param relations: Relations of :meth:`_positioned_relations`.
+        """
+        pids = PersistentIdentifier.__table__
+        return select([
+            pids.c.id, pids.c.pid_type, pids.c.pid_value, pids.c.status,
+            pids.c.object_uuid, relations.c.position,
+        ]).select_from(pids.join(relations, onclause)).where(and_(*filters))
+
+    def _execute_records(self, statement):
+        """Execute a statement of :meth:`_select_records`."""
+        # NOTE: Unlike ORM queries, statements are not autoflushed
+        db.session.flush()
+        return [PIDRecord(*row) for row in db.session.execute(statement)]
+
+    def _prefetched_records(self):
+        """Make the :class:`PIDRecord` of the prefetched children."""
+        records, position = [], 0
+        for relation, pid in self._prefetched:
+            index = None
+            if relation.index is not None:
+                index, position = position, position + 1
+            records.append(PIDRecord(pid.id, pid.pid_type, pid.pid_value,
+                                     pid.status, pid.object_uuid, index))
+        return records
+
+    def get_children_records(self, pid_status=None):
+        """Get the children of the parent as read-only records.
+
+        Same children as :meth:`get_children`, ordered as in
+        :meth:`children_page`, without loading them in the session.
+
+        :returns: List of :class:`PIDRecord`.
+        """
+        if self._prefetched is not None:
+            return [r for r in self._prefetched_records()
+                    if pid_status is None or r.status == pid_status]
+        relations = self._positioned_relations(*self._children_filters())
+        filters = []
+        if pid_status is not None:
+            filters.append(PersistentIdentifier.status == pid_status)
+        return self._execute_records(self._select_records(
+            relations, relations.c.child_id == PersistentIdentifier.id,
+            *filters
+        ).order_by(relations.c.index.is_(None), relations.c.index,
+                   relations.c.child_id))
+
+    def _children_filters(self):
+        """Get the filters of the relations of the parent."""
+        filters = [PIDRelation.parent_id == self.parent.id]
+        if self.relation_type is not None:
+            filters.append(PIDRelation.relation_type == self.relation_type)
+        return filters
+
+    @property
+    def children_records(self):
+        """Children of the parent as read-only records.
+
+        See :attr:`children`.
+        """
+        return self.get_children_records()
+
+    @property
+    def parent_records(self):
+        """Parents of the child as read-only records (see :attr:`parents`).
+
+        The index of the records is the position of the child in the parent.
+        """
+        filters = [PIDRelation.child_id == self.child.id]
+        if self.relation_type is not None:
+            filters.append(PIDRelation.relation_type == self.relation_type)
+        # NOTE: The positions are numbered over the siblings of the child
+        parents = select([PIDRelation.parent_id]).where(
+            and_(*filters)).correlate(None)
+        relations = self._positioned_relations(
+            PIDRelation.parent_id.in_(parents), *filters[1:])
+        return self._execute_records(self._select_records(
+            relations, relations.c.parent_id == PersistentIdentifier.id,
+            relations.c.child_id == self.child.id,
+        ).order_by(relations.c.parent_id))
+
+    @property
+    def last_child_record(self):
+        """Last child of the parent as a read-only record.
+
+        See :attr:`last_child`.
+        """
+        if self.parent is None:
+            return None
+        return self._get_last_child_record()
+
+    def _get_last_child_record(self, pid_status=None):
+        """Query the last child of the parent as a read-only record."""
+        if self._prefetched is not None:
+            children = [r for r in self._prefetched_records()
+                        if r.index is not None and
+                        (pid_status is None or r.status == pid_status)]
+            return children[-1] if children else None
+        relations = self._positioned_relations(*self._children_filters())
+        filters = [relations.c.index.isnot(None)]
+        if pid_status is not None:
+            filters.append(PersistentIdentifier.status == pid_status)
+        records = self._execute_records(self._select_records(
+            relations, relations.c.child_id == PersistentIdentifier.id,
+            *filters
+        ).order_by(relations.c.index.desc()).limit(1))
+        return records[0] if records else None
+
+    @property
+    def children_count(self):
+        """Number of children of the parent."""
+        if self._prefetched is not None:
+            return self.children.count()
+        head = self.head
+        if head is not None:
+            return head.children_count
+        return self.children.count()
+
     @property
     def has_children(self):
         """Determine if there are any children in this relationship."""
-        return self.children.count() > 0
+        return self.children_count > 0
+
+    @property
+    def head(self):
+        """Denormalized head of the concept, if it is maintained.
+
+        None as well if the relations of the concept were modified without
+        the API in the current transaction (see :func:`mark_heads_stale`).
+        """
+        if self.parent is None or self.relation_type is None:
+            return None
+        key = (self.parent.id, self.relation_type)
+        if key in db.session.info.get('pidrelations_stale_heads', ()):
+            return None
+        return PIDConceptHead.query.get(key)
 
     @property
     def is_last_child(self):
@@ -155,27 +551,54 @@ class PIDConcept(object):
         If the 'pid' is a Version PID, return the latest of its siblings.
         Return None for the non-versioned PIDs.
         """
-        return self.get_children(ordered=False).filter(
+        if self.parent is None:
+            return None
+        if self._prefetched is None:
+            head = self.head
+            if head is not None:
+                return head.last_child
+        return self._get_last_child()
+
+    def _get_last_child(self, pid_status=None):
+        """Query the last child of the parent."""
+        if self._prefetched is not None:
+            children = [pid for relation, pid in self._prefetched
+                        if relation.index is not None and
+                        (pid_status is None or pid.status == pid_status)]
+            return children[-1] if children else None
+        return self.get_children(ordered=False, pid_status=pid_status).filter(
             PIDRelation.index.isnot(None)).order_by(
                 PIDRelation.index.desc()).first()
 
     @property
     def next(self):
         """Get the next sibling in the PID relation."""
-        if self.relation.index is not None:
+        if self.relation.index is None:
+            return None
+        elif self._prefetched is not None:
+            return self._get_prefetched_sibling(1)
+        elif self.index_gap:
+            return self.children.filter(
+                PIDRelation.index > self.relation.index).order_by(
+                    None).order_by(PIDRelation.index.asc()).first()
+        else:
             return self.children.filter_by(
                 index=self.relation.index + 1).one_or_none()
-        else:
-            return None
 
     @property
     def previous(self):
         """Get the previous sibling in the PID relation."""
-        if self.relation.index is not None:
+        if self.relation.index is None:
+            return None
+        elif self._prefetched is not None:
+            return self._get_prefetched_sibling(-1)
+        elif self.index_gap:
+            return self.children.filter(
+                PIDRelation.index < self.relation.index).order_by(
+                    None).order_by(PIDRelation.index.desc()).first()
+        else:
             return self.children.filter_by(
                 index=self.relation.index - 1).one_or_none()
-        else:
-            return None
 
     @property
     def is_child(self):
@@ -186,6 +609,163 @@ class PIDConcept(object):
         """
         return self.has_parents
 
+    @staticmethod
+    def _traversal(pid, upwards, max_depth=None, relation_types=None):
+        """Build the recursive CTE of the PIDs reachable from a PID.
+
+        Each row is a PID reached at given depth, other than the PID itself.
+        ``UNION`` drops the rows already reached, so that each PID is
+        followed at most once per depth, instead of once per path. Without a
+        maximum depth, the depth is bounded by the number of reachable PIDs,
+        which the nearest depth of a PID cannot exceed, so that cycles end.
+        """
+        def hop(relations):
+            near, far = (relations.c.child_id, relations.c.parent_id) \
+                if upwards else (relations.c.parent_id, relations.c.child_id)
+            filters = [far != pid.id]
+            if relation_types is not None:
+                filters.append(relations.c.relation_type.in_(relation_types))
+            return near, far, filters
+
+        relations = PIDRelation.__table__
+        near, far, filters = hop(relations)
+        seed = select([far.label('pid_id')]).where(and_(near == pid.id,
+                                                        *filters))
+        if max_depth is None:
+            reachable = seed.cte('reachable', recursive=True)
+            near, far, filters = hop(relations.alias('reachable_hop'))
+            reachable = reachable.union(select([far]).where(and_(
+                near == reachable.c.pid_id, *filters)))
+            max_depth = select([func.count()]).select_from(
+                reachable).as_scalar()
+
+        near, far, filters = hop(relations)
+        traversal = select([far.label('pid_id'), literal(1).label('depth')])
+        traversal = traversal.where(and_(near == pid.id, *filters)).cte(
+            'traversal', recursive=True)
+        near, far, filters = hop(relations.alias('hop'))
+        return traversal.union(select([far, traversal.c.depth + 1]).where(
+            and_(near == traversal.c.pid_id, traversal.c.depth < max_depth,
+                 *filters)))
+
+    @staticmethod
+    def _closure(pid, upwards, max_depth, relation_types):
+        """Select the closure rows of the paths from a PID, if maintained.
+
+        None if the paths are not all of a relation type whose closure is
+        maintained (see :mod:`invenio_pidrelations.closure`).
+        """
+        if relation_types is None or len(relation_types) != 1 or \
+                relation_types[0] not in closure_relation_types():
+            return None
+        c = PIDRelationClosure
+        near, far = (c.descendant_id, c.ancestor_id) if upwards else \
+            (c.ancestor_id, c.descendant_id)
+        query = select([far.label('pid_id'), c.depth]).where(and_(
+            near == pid.id, c.relation_type == relation_types[0]))
+        if max_depth is not None:
+            query = query.where(c.depth <= max_depth)
+        return query
+
+    def _reachable(self, pid, upwards, max_depth, relation_types):
+        """Get the PIDs reachable from a PID, nearest first."""
+        if pid is None:
+            return []
+        paths = self._closure(pid, upwards, max_depth, relation_types)
+        if paths is None:
+            paths = select([
+                self._traversal(pid, upwards, max_depth, relation_types)])
+        paths = paths.alias('paths')
+        reached = select([
+            paths.c.pid_id, func.min(paths.c.depth).label('depth'),
+        ]).group_by(paths.c.pid_id).alias('reached')
+        return db.session.query(PersistentIdentifier).join(
+            reached, reached.c.pid_id == PersistentIdentifier.id
+        ).order_by(reached.c.depth, PersistentIdentifier.id).all()
+
+    def ancestors(self, max_depth=None, relation_types=None):
+        """Get all the ancestors of the child, with a single query.
+
+        The parents of the child (see :attr:`parents`), their own parents
+        and so on, in relations of any type. Cycles are followed only once.
+
+        :param max_depth: Maximum number of relations between the child and
+            an ancestor (unlimited if None).
+        :param relation_types: Ids of the types of the followed relations
+            (all types if None).
+        :returns: List of PIDs, nearest first.
+        """
+        return self._reachable(self.child, True, max_depth, relation_types)
+
+    def descendants(self, max_depth=None, relation_types=None):
+        """Get all the descendants of the parent, with a single query.
+
+        The children of the parent (see :attr:`children`), their own
+        children and so on (see :meth:`ancestors`).
+
+        :returns: List of PIDs, nearest first.
+        """
+        return self._reachable(self.parent, False, max_depth, relation_types)
+
+    def is_descendant_of(self, ancestor, max_depth=None,
+                         relation_types=None):
+        """Determine if the child is a descendant of a PID.
+
+        Reads the closure table if it is maintained for the relation type,
+        otherwise stops the traversal of the ancestors (see
+        :meth:`ancestors`) at the first match.
+        """
+        if self.child is None:
+            return False
+        paths = self._closure(self.child, True, max_depth, relation_types)
+        if paths is None:
+            paths = select([
+                self._traversal(self.child, True, max_depth, relation_types)])
+        paths = paths.alias('paths')
+        return db.session.execute(select([paths.c.pid_id]).where(
+            paths.c.pid_id == ancestor.id).limit(1)).first() is not None
+
+    def subgraph(self, max_depth=None, relation_types=None):
+        """Get the relations between the descendants of the parent.
+
+        All the relations followed to reach the descendants of the parent
+        (see :meth:`descendants`), with a single query.
+
+        :returns: List of :class:`invenio_pidrelations.models.PIDRelation`,
+            nearest first.
+        """
+        if self.parent is None:
+            return []
+        traversal = self._traversal(
+            self.parent, False, max_depth, relation_types)
+        reached = select([
+            traversal.c.pid_id, func.min(traversal.c.depth).label('depth'),
+        ]).group_by(traversal.c.pid_id).union_all(select([
+            literal(self.parent.id), literal(0),
+        ])).alias('reached')
+        query = PIDRelation.query.join(
+            reached, reached.c.pid_id == PIDRelation.parent_id
+        ).filter(PIDRelation.child_id != self.parent.id)
+        if relation_types is not None:
+            query = query.filter(PIDRelation.relation_type.in_(relation_types))
+        if max_depth is not None:
+            query = query.filter(reached.c.depth < max_depth)
+        return query.order_by(reached.c.depth, PIDRelation.parent_id,
+                              PIDRelation.index, PIDRelation.child_id).all()
+
+    def lock(self):
+        """Lock the concept until the end of the current transaction.
+
+        Taken by all the methods modifying the children, so that concurrent
+        modifications of the concept are serialized (see
+        :func:`invenio_pidrelations.locks.lock_concept`). Does nothing if
+        ``PIDRELATIONS_LOCK_CONCEPTS`` is disabled, concurrent modifications
+        being then only detected with the revision of the concept.
+        """
+        if current_app.config['PIDRELATIONS_LOCK_CONCEPTS']:
+            lock_concept(self.parent)
+
+    @retry_on_conflict
     def insert_child(self, child, index=None):
         """Insert a new child into a PID concept.
 
@@ -197,10 +777,17 @@ class PIDConcept(object):
             NOTE: If 'index' is specified, all sibling relations should
                   have PIDRelation.index information.
 
+        For relation types with sparse ordering (see
+        ``PIDRELATIONS_INDEX_GAPS``) only the new relation is written.
         """
+        self.lock()
         try:
             with db.session.begin_nested():
-                if index is not None:
+                if index is not None and self.index_gap:
+                    relation_obj = PIDRelation.create(
+                        self.parent, child, self.relation_type,
+                        self._sparse_index(index))
+                elif index is not None:
                     child_relations = self.parent.child_relations.filter(
                         PIDRelation.relation_type ==
                         self.relation_type).order_by(PIDRelation.index).all()
@@ -215,27 +802,463 @@ class PIDConcept(object):
                 else:
                     relation_obj = PIDRelation.create(
                         self.parent, child, self.relation_type, None)
+                self.update_head()
+            self._prefetched = None
+            clear_concept_cache()
             # TODO: self.child = child
-            # TODO: mark 'children' cached_property as dirty
         except IntegrityError:
             raise Exception("PID Relation already exists.")
 
+    @retry_on_conflict
+    def insert_children(self, children, index=-1):
+        """Insert many new children into a PID concept at once.
+
+        Same as inserting the children one after the other with
+        :meth:`insert_child` at consecutive positions starting from
+        ``index``, except that the siblings are renumbered at most once.
+        Appending the children (``index=-1``) does not renumber them at all.
+        """
+        children = list(children)
+        if not children:
+            return
+        self.lock()
+        try:
+            with db.session.begin_nested():
+                relations = [PIDRelation(
+                    parent_id=self.parent.id, child_id=child.id,
+                    relation_type=self.relation_type) for child in children]
+                if index is not None:
+                    self._index_new_children(relations, index)
+                db.session.add_all(relations)
+                self.update_head()
+            self._prefetched = None
+            clear_concept_cache()
+        except IntegrityError:
+            raise Exception("PID Relation already exists.")
+
+    def _index_new_children(self, relations, position):
+        """Set the indices of new child relations inserted at a position."""
+        gap = self.index_gap
+        indices = None
+        if gap:
+            indices = self._sparse_indices(position, len(relations))
+        elif position == -1:
+            last = db.session.query(func.max(PIDRelation.index)).filter(
+                PIDRelation.parent_id == self.parent.id,
+                PIDRelation.relation_type == self.relation_type).scalar()
+            start = last + 1 if last is not None else 0
+            indices = range(start, start + len(relations))
+        if indices is not None:
+            for relation, idx in zip(relations, indices):
+                relation.index = idx
+            return
+        # Single renumbering pass over all the siblings
+        child_relations = self.parent.child_relations.filter(
+            PIDRelation.relation_type == self.relation_type).order_by(
+                PIDRelation.index, PIDRelation.child_id).all()
+        if position == -1:
+            child_relations.extend(relations)
+        else:
+            child_relations[position:position] = relations
+        for idx, c in enumerate(child_relations):
+            # NOTE: Touching unchanged relations would update their timestamp
+            if c.index != idx * (gap or 1):
+                c.index = idx * (gap or 1)
+
+    @retry_on_conflict
     def remove_child(self, child, reorder=False):
         """Remove a child from a PID concept."""
+        self.lock()
         with db.session.begin_nested():
             relation = PIDRelation.query.filter_by(
                 parent_id=self.parent.id,
                 child_id=child.id,
                 relation_type=self.relation_type).one()
             db.session.delete(relation)
-            if reorder:
+            if reorder and not self.index_gap:
                 child_relations = self.parent.child_relations.filter(
                     PIDRelation.relation_type == self.relation_type).order_by(
                         PIDRelation.index).all()
                 for idx, c in enumerate(child_relations):
                     c.index = idx
+            self.update_head()
+        self._prefetched = None
+        clear_concept_cache()
         # TODO: self.child = None
-        # TODO: mark 'children' cached_property as dirty
+
+    def neighbourhood(self):
+        """Get the position of the child among its siblings.
+
+        Computes the values of :attr:`is_ordered`, :attr:`index`,
+        :attr:`previous`, :attr:`next`, :attr:`children_count` and whether
+        the child is the last of the :attr:`children`, with a single query
+        using window functions.
+
+        :returns: A :class:`Neighbourhood`, or None if the PID is not a child
+            in the relation.
+        """
+        if self.child is None or self.parent is None or \
+                self.relation_type is None:
+            return None
+        if self._prefetched is not None:
+            return self._prefetched_neighbourhood()
+
+        children = self.children.order_by(None).with_entities(
+            PersistentIdentifier.id).statement.correlate(None)
+        is_child = PIDRelation.child_id.in_(children)
+        order = (PIDRelation.index.is_(None), PIDRelation.index,
+                 PIDRelation.child_id)
+        # The child itself is kept in the window even if it is filtered out
+        # of the children, e.g. a draft version
+        siblings = db.session.query(
+            PIDRelation.child_id.label('child_id'),
+            PIDRelation.index.label('index'),
+            case([(is_child, 1)], else_=0).label('is_child'),
+            func.lag(PIDRelation.child_id).over(
+                order_by=order).label('previous_id'),
+            func.lag(PIDRelation.index).over(
+                order_by=order).label('previous_index'),
+            func.lead(PIDRelation.child_id).over(
+                order_by=order).label('next_id'),
+            func.lead(PIDRelation.index).over(
+                order_by=order).label('next_index'),
+            func.count().over().label('count'),
+        ).filter(
+            PIDRelation.parent_id == self.parent.id,
+            PIDRelation.relation_type == self.relation_type,
+            or_(is_child, PIDRelation.child_id == self.child.id),
+        ).subquery()
+
+        previous = aliased(PersistentIdentifier, name='previous')
+        next_ = aliased(PersistentIdentifier, name='next')
+        before = aliased(PIDRelation, name='before')
+        position = db.session.query(func.count()).filter(
+            before.parent_id == self.parent.id,
+            before.relation_type == self.relation_type,
+            before.index < siblings.c.index).as_scalar()
+        row = db.session.query(
+            siblings.c.index, siblings.c.is_child, siblings.c.count,
+            siblings.c.previous_index, siblings.c.next_index,
+            position if self.index_gap else siblings.c.index,
+            previous, next_,
+        ).select_from(siblings).outerjoin(
+            previous, previous.id == siblings.c.previous_id
+        ).outerjoin(
+            next_, next_.id == siblings.c.next_id
+        ).filter(siblings.c.child_id == self.child.id).one_or_none()
+        if row is None:
+            return None
+        (index, is_child, count, previous_index, next_index, position,
+         previous, next_) = row
+        return self._make_neighbourhood(
+            index, position, (previous_index, previous), (next_index, next_),
+            bool(is_child), count - (0 if is_child else 1))
+
+    def _prefetched_neighbourhood(self):
+        """Compute the neighbourhood of the child from the prefetched data."""
+        children = set(self.children)
+        siblings = [(r.index, pid) for r, pid in self._prefetched
+                    if pid in children or pid == self.child]
+        pids = [pid for index, pid in siblings]
+        if self.child not in pids:
+            return None
+        pos = pids.index(self.child)
+        index = siblings[pos][0]
+        position = index
+        if index is not None and self.index_gap:
+            position = len([r for r, pid in self._prefetched
+                            if r.index is not None and r.index < index])
+        previous = siblings[pos - 1] if pos > 0 else (None, None)
+        next_ = siblings[pos + 1] if pos + 1 < len(siblings) else (None, None)
+        is_child = self.child in children
+        return self._make_neighbourhood(
+            index, position, previous, next_, is_child,
+            len(siblings) - (0 if is_child else 1))
+
+    def _make_neighbourhood(self, index, position, previous, next_, is_child,
+                            children_count):
+        """Build the neighbourhood of the child from its adjacent siblings.
+
+        Siblings are given as ``(index, pid)`` pairs. The rules of
+        :attr:`previous` and :attr:`next` apply: with dense ordering only
+        the siblings at the adjacent indices are neighbours.
+        """
+        def neighbour(sibling, step):
+            sibling_index, pid = sibling
+            if index is None or sibling_index is None:
+                return None
+            if not self.index_gap and sibling_index != index + step:
+                return None
+            return pid
+
+        # NOTE: Same result as 'is_ordered', whose query rows are never None
+        return Neighbourhood(
+            is_ordered=True,
+            index=position,
+            previous=neighbour(previous, -1),
+            next=neighbour(next_, 1),
+            is_last=is_child and next_[1] is None,
+            children_count=children_count,
+        )
+
+    def _get_prefetched_sibling(self, step):
+        """Get the next (step=1) or previous (step=-1) prefetched sibling."""
+        children = set(self.children)
+        indices = [(relation.index, pid) for relation, pid in self._prefetched
+                   if relation.index is not None and pid in children]
+        if self.index_gap:
+            if step > 0:
+                siblings = [pid for index, pid in indices
+                            if index > self.relation.index]
+                return siblings[0] if siblings else None
+            siblings = [pid for index, pid in indices
+                        if index < self.relation.index]
+            return siblings[-1] if siblings else None
+        return PrefetchedChildren(
+            pid for index, pid in indices
+            if index == self.relation.index + step).one_or_none()
+
+    @classmethod
+    def bulk(cls, pids, relation_type):
+        """Load the concepts of many child PIDs at once.
+
+        The relations, parents and siblings of all the PIDs are fetched with
+        a fixed number of queries. The properties of the returned concepts
+        are then computed from the prefetched data without querying the
+        database again.
+
+        :param pids: Child PIDs of the concepts.
+        :param relation_type: Relation type id of the concepts.
+        :returns: List of concept objects, in the order of ``pids``.
+        """
+        pids = list(pids)
+        relations = {}
+        if pids:
+            for relation in PIDRelation.query.filter(
+                    PIDRelation.child_id.in_([p.id for p in pids]),
+                    PIDRelation.relation_type == relation_type):
+                if relation.child_id in relations:
+                    raise MultipleResultsFound(
+                        "Multiple parents were found for the PID "
+                        "{0}".format(relation.child_id))
+                relations[relation.child_id] = relation
+        parent_ids = set(r.parent_id for r in relations.values())
+        parents = {}
+        if parent_ids:
+            parents = dict(
+                (p.id, p) for p in PersistentIdentifier.query.filter(
+                    PersistentIdentifier.id.in_(parent_ids)))
+        siblings = cls._prefetch_children(parent_ids, relation_type)
+
+        concepts = []
+        for pid in pids:
+            concept = cls.__new__(cls)
+            relation = relations.get(pid.id)
+            parent = parents[relation.parent_id] if relation else None
+            PIDConcept.__init__(concept, child=pid, parent=parent,
+                                relation_type=relation_type)
+            concept.relation = relation
+            concept._prefetched = siblings.get(parent.id, []) \
+                if parent else []
+            concepts.append(concept)
+        return concepts
+
+    @classmethod
+    def bulk_relations(cls, relations):
+        """Load the concepts of many relations at once.
+
+        Unlike :meth:`bulk`, a child PID may take part in several of the
+        relations, e.g. with different parents.
+
+        :param relations: Relations of the concepts.
+        :returns: List of concept objects, in the order of ``relations``.
+        """
+        relations = list(relations)
+        parent_ids = {}
+        for relation in relations:
+            parent_ids.setdefault(relation.relation_type, set()).add(
+                relation.parent_id)
+        if relations:
+            # Load the parents into the session, for the relations to use
+            PersistentIdentifier.query.filter(PersistentIdentifier.id.in_(
+                set(r.parent_id for r in relations))).all()
+        siblings = dict(
+            (relation_type, cls._prefetch_children(ids, relation_type))
+            for relation_type, ids in parent_ids.items())
+
+        concepts = []
+        for relation in relations:
+            concept = cls.__new__(cls)
+            PIDConcept.__init__(concept, relation=relation)
+            concept._prefetched = siblings[relation.relation_type].get(
+                relation.parent_id, [])
+            concepts.append(concept)
+        return concepts
+
+    @classmethod
+    def bulk_parents(cls, pids, relation_type):
+        """Load the concepts of many parent PIDs at once.
+
+        The children of all the PIDs are fetched with a single query.
+
+        :param pids: Parent PIDs of the concepts.
+        :param relation_type: Relation type id of the concepts.
+        :returns: List of concept objects, in the order of ``pids``.
+        """
+        pids = list(pids)
+        children = cls._prefetch_children(
+            set(p.id for p in pids), relation_type)
+        concepts = []
+        for pid in pids:
+            concept = cls.__new__(cls)
+            PIDConcept.__init__(concept, parent=pid,
+                                relation_type=relation_type)
+            concept._prefetched = children.get(pid.id, [])
+            concepts.append(concept)
+        return concepts
+
+    @staticmethod
+    def _prefetch_children(parent_ids, relation_type):
+        """Fetch the (relation, child) pairs of many parents at once."""
+        children = {}
+        if not parent_ids:
+            return children
+        rows = db.session.query(PIDRelation, PersistentIdentifier).join(
+            PersistentIdentifier,
+            PIDRelation.child_id == PersistentIdentifier.id
+        ).filter(
+            PIDRelation.parent_id.in_(parent_ids),
+            PIDRelation.relation_type == relation_type,
+        )
+        for relation, pid in rows:
+            children.setdefault(relation.parent_id, []).append(
+                (relation, pid))
+        for pairs in children.values():
+            pairs.sort(key=lambda c: (c[0].index is None, c[0].index,
+                                      c[0].child_id))
+        return children
+
+    @classmethod
+    def load(cls, child=None, parent=None, relation_type=None):
+        """Get the concept of a child or of a parent PID.
+
+        The concept is cached for the current database session, until a
+        relation is modified. Its properties are queried lazily, thus unlike
+        :meth:`bulk` the siblings are only loaded if they are needed.
+
+        :param child: Child PID of the concept.
+        :param parent: Parent PID of the concept (if no child is given).
+        :param relation_type: Relation type id of the concept, defaults to
+            the relation type the API is bound to.
+        """
+        if relation_type is None:
+            relation_type = resolve_relation_type_config(
+                cls.relation_type_name).id
+        pid = child if child is not None else parent
+        key = (cls, pid.id, relation_type, child is not None)
+        cache = concept_cache()
+        if key not in cache:
+            concept = cls.__new__(cls)
+            PIDConcept.__init__(concept, child=child, parent=parent,
+                                relation_type=relation_type)
+            cache[key] = concept
+        return cache[key]
+
+    def update_head(self):
+        """Update the denormalized head of the concept from its relations.
+
+        The revision of the head is incremented, with a compare-and-swap on
+        the revision read before (see
+        :func:`invenio_pidrelations.locks.retry_on_conflict`).
+        """
+        # NOTE: Query before modifying the head, which would be autoflushed
+        children_count = self.children.count()
+        last_child = self._get_last_child()
+        key = (self.parent.id, self.relation_type)
+        head = PIDConceptHead.query.get(key)
+        if head is None:
+            head = PIDConceptHead(parent_id=self.parent.id,
+                                  relation_type=self.relation_type)
+            db.session.add(head)
+        head.children_count = children_count
+        head.last_child = last_child
+        # Bump the revision even if the count and last child are the same
+        flag_modified(head, 'children_count')
+        try:
+            with db.session.begin_nested():
+                db.session.flush()
+        except IntegrityError:
+            # NOTE: The head was created concurrently
+            raise ConceptConflictError(
+                "The concept of PID {0} was modified concurrently.".format(
+                    self.parent.id))
+        db.session.info.get('pidrelations_stale_heads', set()).discard(key)
+
+    @property
+    def revision(self):
+        """Revision of the concept, incremented on each modification.
+
+        Can be used to skip work when a concept did not change, e.g. to
+        build an ETag. None if the head of the concept is not maintained.
+        """
+        head = self.head
+        return head.revision if head is not None else None
+
+    def _sparse_index(self, position):
+        """Compute the stored index placing a new child at given position.
+
+        Takes the middle of the gap between the neighbouring children and
+        rebalances all stored indices only if there is no gap left.
+        """
+        indices = self._sparse_indices(position, 1)
+        if indices is None:
+            self._rebalance_indices()
+            indices = self._sparse_indices(position, 1)
+        return indices[0]
+
+    def _sparse_indices(self, position, count):
+        """Compute the stored indices placing new children at given position.
+
+        The children are spread evenly in the gap between their neighbours,
+        the unordered children being ignored. Returns None if the gap is too
+        small to hold them.
+        """
+        gap = self.index_gap
+        indices = db.session.query(PIDRelation.index).filter(
+            PIDRelation.parent_id == self.parent.id,
+            PIDRelation.relation_type == self.relation_type,
+            PIDRelation.index.isnot(None))
+        if position < -1:
+            position = max(indices.count() + position, 0)
+        if position == -1:
+            last = indices.order_by(PIDRelation.index.desc()).first()
+            start = last[0] + gap if last else 0
+            return [start + idx * gap for idx in range(count)]
+        if position == 0:
+            first = indices.order_by(PIDRelation.index.asc()).first()
+            start = first[0] - count * gap if first else 0
+            return [start + idx * gap for idx in range(count)]
+        around = [r[0] for r in indices.order_by(
+            PIDRelation.index.asc()).offset(position - 1).limit(2)]
+        if not around:
+            return self._sparse_indices(-1, count)
+        elif len(around) == 1:
+            return [around[0] + (idx + 1) * gap for idx in range(count)]
+        lower, upper = around
+        step = (upper - lower) // (count + 1)
+        if step < 1:
+            return None
+        return [lower + (idx + 1) * step for idx in range(count)]
+
+    def _rebalance_indices(self):
+        """Spread the stored indices of the ordered children by the gap."""
+        child_relations = self.parent.child_relations.filter(
+            PIDRelation.relation_type == self.relation_type,
+            PIDRelation.index.isnot(None)).order_by(
+                PIDRelation.index, PIDRelation.child_id).all()
+        for idx, c in enumerate(child_relations):
+            c.index = idx * self.index_gap
+        db.session.flush()
 
 
 class PIDConceptOrdered(PIDConcept):
@@ -252,7 +1275,95 @@ class PIDConceptOrdered(PIDConcept):
         return True
 
 
+def mark_heads_stale(session, concepts):
+    """Mark the heads of concepts as stale, until they are updated.
+
+    Relations modified through the ORM are tracked automatically; this has
+    to be called for relations modified with SQL statements only.
+
+    :param concepts: Iterable of ``(parent_id, relation_type)`` tuples.
+    """
+    session.info.setdefault('pidrelations_stale_heads', set()).update(
+        concepts)
+
+
+def update_stale_heads(session):
+    """Update the existing heads marked as stale in a session.
+
+    The heads are updated in place, thus their revision keeps increasing.
+    """
+    stale = session.info.pop('pidrelations_stale_heads', None)
+    if not stale:
+        return
+    heads = session.query(
+        PIDConceptHead.parent_id, PIDConceptHead.relation_type
+    ).filter(or_(*[and_(PIDConceptHead.parent_id == parent_id,
+                        PIDConceptHead.relation_type == relation_type)
+                   for parent_id, relation_type in stale]))
+    for parent_id, relation_type in heads.all():
+        _head_concept(parent_id, relation_type).update_head()
+
+
+def _head_concept(parent_id, relation_type):
+    """Get the concept API of the head of a parent PID."""
+    api_class = resolve_relation_type_config(relation_type).api
+    concept = api_class.__new__(api_class)
+    PIDConcept.__init__(
+        concept, parent=PersistentIdentifier.query.get(parent_id),
+        relation_type=relation_type)
+    return concept
+
+
+@event.listens_for(PIDRelation, 'after_insert')
+@event.listens_for(PIDRelation, 'after_update')
+@event.listens_for(PIDRelation, 'after_delete')
+def _mark_head_stale(mapper, connection, target):
+    """Track the heads of the concepts whose relations are modified.
+
+    The concept API updates the heads itself once the relations are
+    flushed, which clears the marks (see :meth:`PIDConcept.update_head`).
+    """
+    session = object_session(target)
+    if session is not None:
+        mark_heads_stale(session, [(target.parent_id, target.relation_type)])
+
+
+@event.listens_for(Session, 'before_commit')
+def _update_stale_heads_on_commit(session):
+    """Update the heads left stale once the transaction is committed."""
+    if session.transaction.parent is None:
+        session.flush()
+        update_stale_heads(session)
+
+
+def rebuild_concept_heads(relation_type=None):
+    """Rebuild the denormalized concept heads from the relations.
+
+    The existing heads are updated in place, thus their revision keeps
+    increasing, and the missing ones are created.
+
+    :param relation_type: Rebuild only the heads of this relation type id.
+    """
+    heads = db.session.query(
+        PIDConceptHead.parent_id, PIDConceptHead.relation_type)
+    concepts = db.session.query(
+        PIDRelation.parent_id, PIDRelation.relation_type)
+    if relation_type is not None:
+        heads = heads.filter_by(relation_type=relation_type)
+        concepts = concepts.filter_by(relation_type=relation_type)
+    for parent_id, type_id in heads.union(concepts).all():
+        _head_concept(parent_id, type_id).update_head()
+
+
 __all__ = (
+    'ChildrenPage',
+    'ChildrenWindow',
+    'Neighbourhood',
     'PIDConcept',
     'PIDConceptOrdered',
+    'PIDRecord',
+    'PrefetchedChildren',
+    'mark_heads_stale',
+    'rebuild_concept_heads',
+    'update_stale_heads',
 )
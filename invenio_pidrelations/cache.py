@@ -0,0 +1,251 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Caching of PID relations."""
+
+from __future__ import absolute_import, print_function
+
+import json
+import threading
+
+from flask import current_app, has_app_context
+from invenio_db import db
+from sqlalchemy import event
+from sqlalchemy.orm import Session, object_session
+
+from .models import PIDConceptHead, PIDRelation
+
+
+def concept_cache():
+    """Get the concepts cached for the current database session.
+
+    The cache lives as long as the session (i.e. the application context)
+    and is cleared whenever a relation is modified or the session is
+    rolled back.
+    """
+    return db.session.info.setdefault('pidrelations_concepts', {})
+
+
+def clear_concept_cache(session=None):
+    """Clear the concepts cached for the session."""
+    session = session or db.session
+    session.info.pop('pidrelations_concepts', None)
+
+
+class InMemoryBackend(object):
+    """Process-local cache backend implementing a subset of Redis commands.
+
+    Meant for tests and single process deployments. Any client providing
+    the same commands, e.g. ``redis.StrictRedis``, can be used instead.
+    """
+
+    def __init__(self):
+        """Initialize the backend."""
+        self._data = {}
+        self._lock = threading.Lock()
+
+    def get(self, name):
+        """Get the value of a key."""
+        return self._data.get(name)
+
+    def mget(self, keys, *args):
+        """Get the values of many keys."""
+        return [self._data.get(k) for k in list(keys) + list(args)]
+
+    def set(self, name, value, ex=None, nx=False):
+        """Set the value of a key (the expiration time is ignored).
+
+        With ``nx``, the key is set only if it does not exist yet.
+        """
+        with self._lock:
+            if nx and name in self._data:
+                return None
+            self._data[name] = value
+        return True
+
+    def incr(self, name, amount=1):
+        """Increment the integer value of a key."""
+        with self._lock:
+            value = int(self._data.get(name, 0)) + amount
+            self._data[name] = value
+        return value
+
+    def sadd(self, name, *values):
+        """Add values to the set of a key."""
+        with self._lock:
+            members = self._data.setdefault(name, set())
+            added = len(set(values) - members)
+            members.update(values)
+        return added
+
+    def spop(self, name, count=None):
+        """Remove and return random members of the set of a key."""
+        with self._lock:
+            members = self._data.get(name, set())
+            popped = [members.pop() for _ in range(
+                min(len(members), 1 if count is None else count))]
+            if not members:
+                self._data.pop(name, None)
+        if count is None:
+            return popped[0] if popped else None
+        return popped
+
+    def delete(self, *names):
+        """Delete keys."""
+        return len([self._data.pop(n) for n in names if n in self._data])
+
+
+class RelationsCache(object):
+    """Cache of serialized PID relations shared between processes.
+
+    The relations of a PID are stored under a key made of the stamps of all
+    the concepts the PID takes part in, i.e. its parents and itself as a
+    parent. The stamp of a concept is bumped whenever one of its relations
+    changes, which makes the cached relations of all its members stale at
+    once.
+    """
+
+    def __init__(self, backend, prefix='pidrelations', ttl=None):
+        """Initialize the cache.
+
+        :param backend: Redis-like client (see :class:`InMemoryBackend`).
+        :param prefix: Prefix of all the keys.
+        :param ttl: Expiration time of the cached relations in seconds.
+        """
+        self.backend = backend
+        self.prefix = prefix
+        self.ttl = ttl
+
+    def _stamp_key(self, concept_id):
+        return '{0}:stamp:{1}'.format(self.prefix, concept_id)
+
+    def _relations_key(self, pid_id, stamps):
+        return '{0}:relations:{1}:{2}'.format(
+            self.prefix, pid_id, ','.join(
+                '{0}-{1}'.format(c, s) for c, s in sorted(stamps.items())))
+
+    def get_stamps(self, concept_ids):
+        """Get the current stamps of concepts (parent PID ids)."""
+        concept_ids = list(concept_ids)
+        values = self.backend.mget(
+            [self._stamp_key(c) for c in concept_ids]) if concept_ids else []
+        return dict((c, int(v or 0)) for c, v in zip(concept_ids, values))
+
+    def bump(self, concept_ids):
+        """Bump the stamps of concepts (parent PID ids)."""
+        for concept_id in concept_ids:
+            self.backend.incr(self._stamp_key(concept_id))
+
+    def get(self, pid_id, stamps):
+        """Get the cached relations of a PID or None."""
+        return self._load(self.backend.get(
+            self._relations_key(pid_id, stamps)))
+
+    def get_many(self, items):
+        """Get the cached relations of many PIDs at once.
+
+        :param items: List of ``(pid_id, stamps)`` pairs.
+        :returns: List of the cached relations (or None) in the same order.
+        """
+        if not items:
+            return []
+        values = self.backend.mget(
+            [self._relations_key(pid_id, stamps) for pid_id, stamps in items])
+        return [self._load(v) for v in values]
+
+    @staticmethod
+    def _load(value):
+        if value is None:
+            return None
+        if isinstance(value, bytes):
+            value = value.decode('utf-8')
+        return json.loads(value)
+
+    def set(self, pid_id, stamps, relations):
+        """Cache the relations of a PID."""
+        self.backend.set(self._relations_key(pid_id, stamps),
+                         json.dumps(relations), ex=self.ttl)
+
+
+def current_relations_cache():
+    """Get the relations cache of the current application (if enabled)."""
+    if not has_app_context():
+        return None
+    state = current_app.extensions.get('invenio-pidrelations')
+    return state.relations_cache if state else None
+
+
+def mark_concepts_changed(session, concept_ids):
+    """Mark concepts as changed, so that their stamps are bumped.
+
+    Writes done through the ORM are tracked automatically; this has to be
+    called for relations modified with SQL statements only.
+    """
+    for key in ('pidrelations_changed', 'pidrelations_pending'):
+        session.info.setdefault(key, set()).update(concept_ids)
+
+
+def _bump_changed_concepts(session, key, done=False):
+    """Bump the stamps of the concepts changed in the session."""
+    changed = session.info.pop(key, None) if done else session.info.get(key)
+    cache = current_relations_cache()
+    if changed and cache is not None:
+        cache.bump(changed)
+
+
+@event.listens_for(PIDRelation, 'after_insert')
+@event.listens_for(PIDRelation, 'after_update')
+@event.listens_for(PIDRelation, 'after_delete')
+@event.listens_for(PIDConceptHead, 'after_insert')
+@event.listens_for(PIDConceptHead, 'after_update')
+@event.listens_for(PIDConceptHead, 'after_delete')
+def _mark_concept_changed(mapper, connection, target):
+    """Track the concepts modified in a session."""
+    session = object_session(target)
+    if session is not None:
+        mark_concepts_changed(session, [target.parent_id])
+
+
+@event.listens_for(Session, 'after_flush')
+def _bump_on_flush(session, flush_context):
+    """Bump the stamps of the concepts changed since the last flush."""
+    _bump_changed_concepts(session, 'pidrelations_pending', done=True)
+
+
+@event.listens_for(Session, 'after_soft_rollback')
+def _clear_concept_cache_on_rollback(session, previous_transaction):
+    """Clear the cached concepts when the session is rolled back."""
+    clear_concept_cache(session)
+    _bump_changed_concepts(session, 'pidrelations_changed')
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _bump_on_transaction_end(session, transaction):
+    """Bump the stamps of the changed concepts once committed.
+
+    Relations serialized by other processes before the commit are thereby
+    made stale as well.
+    """
+    if transaction.parent is None:
+        _bump_changed_concepts(session, 'pidrelations_changed', done=True)
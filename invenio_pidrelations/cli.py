@@ -0,0 +1,84 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Click command-line interface for PID relations management."""
+
+from __future__ import absolute_import, print_function
+
+import click
+from flask.cli import with_appcontext
+from invenio_db import db
+
+from .api import rebuild_concept_heads
+from .closure import check_closure, rebuild_closure
+from .utils import resolve_relation_type_config
+
+
+@click.group()
+def pidrelations():
+    """PID relations management commands."""
+
+
+@pidrelations.command('rebuild-heads')
+@click.option('--relation-type', '-t', default=None,
+              help='Name of the relation type to rebuild.')
+@with_appcontext
+def rebuild_heads(relation_type):
+    """Rebuild the denormalized heads of the PID concepts."""
+    if relation_type is not None:
+        relation_type = resolve_relation_type_config(relation_type).id
+    rebuild_concept_heads(relation_type=relation_type)
+    db.session.commit()
+    click.secho('Concept heads rebuilt.', fg='green')
+
+
+@pidrelations.command('rebuild-closure')
+@click.option('--relation-type', '-t', default=None,
+              help='Name of the relation type to rebuild.')
+@with_appcontext
+def rebuild_closure_table(relation_type):
+    """Rebuild the closure table of the PID relations."""
+    if relation_type is not None:
+        relation_type = resolve_relation_type_config(relation_type).id
+    rebuild_closure(relation_type=relation_type)
+    db.session.commit()
+    click.secho('Closure table rebuilt.', fg='green')
+
+
+@pidrelations.command('check-closure')
+@click.option('--relation-type', '-t', default=None,
+              help='Name of the relation type to check.')
+@with_appcontext
+def check_closure_table(relation_type):
+    """Check the closure table against the PID relations."""
+    if relation_type is not None:
+        relation_type = resolve_relation_type_config(relation_type).id
+    mismatches = check_closure(relation_type=relation_type)
+    for m in mismatches:
+        click.echo('{0.ancestor_id} -> {0.descendant_id} (Type: '
+                   '{0.relation_type}, Depth: {0.depth}): expected '
+                   '{0.expected} paths, found {0.actual}'.format(m))
+    if mismatches:
+        raise click.ClickException('Closure table is inconsistent.')
+    click.secho('Closure table is consistent.', fg='green')
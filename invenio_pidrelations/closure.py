@@ -0,0 +1,370 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Transitive closure of the PID relations.
+
+The closure of the relation types listed in
+``PIDRELATIONS_CLOSURE_RELATION_TYPES`` is maintained incrementally on each
+creation and removal of a relation through the ORM (e.g. by
+:meth:`invenio_pidrelations.models.PIDRelation.create` and by the concept
+API). Relations written with SQL statements require the closure to be
+rebuilt (see :func:`rebuild_closure`).
+
+Relations of the types listed in ``PIDRELATIONS_ACYCLIC_RELATION_TYPES``
+(or whose closure is maintained) are rejected if they close a cycle (see
+:func:`check_relation_cycle`).
+"""
+
+from __future__ import absolute_import, print_function
+
+from collections import Counter, defaultdict, namedtuple
+
+from flask import current_app, has_app_context
+from invenio_db import db
+from sqlalchemy import and_, bindparam, event, select
+from sqlalchemy.orm.attributes import get_history
+
+from .models import PIDRelation, PIDRelationClosure
+from .proxies import current_pidrelations
+
+closure_table = PIDRelationClosure.__table__
+
+
+class RelationCycleError(Exception):
+    """A relation would make a PID its own ancestor."""
+
+
+ClosureMismatch = namedtuple('ClosureMismatch', [
+    'ancestor_id', 'descendant_id', 'relation_type', 'depth', 'expected',
+    'actual'])
+"""Row of the closure table which differs from the relations (see
+:func:`check_closure`)."""
+
+
+def closure_relation_types():
+    """Get the ids of the relation types whose closure is maintained."""
+    return _configured_relation_types('PIDRELATIONS_CLOSURE_RELATION_TYPES')
+
+
+def acyclic_relation_types():
+    """Get the ids of the relation types whose cycles are prevented."""
+    return _configured_relation_types('PIDRELATIONS_ACYCLIC_RELATION_TYPES')
+
+
+def _configured_relation_types(key):
+    """Get the ids of the relation types named in a configuration variable.
+
+    The names which are not configured relation types are ignored. The API
+    and schema classes of the relation types are not imported.
+    """
+    if not has_app_context():
+        return set()
+    by_name = current_pidrelations.relation_types_by_name
+    return set(by_name[name].id for name in current_app.config.get(key, ())
+               if name in by_name)
+
+
+def _relation_paths(parent_id, child_id, paths_to, paths_from):
+    """Count the paths going through a relation, keyed by closure row.
+
+    :param paths_to: ``(ancestor_id, depth, paths)`` of the paths leading
+        to the parent.
+    :param paths_from: ``(descendant_id, depth, paths)`` of the paths
+        leaving from the child.
+    :returns: Counter of the paths, keyed by ``(ancestor_id, descendant_id,
+        depth)``.
+    """
+    paths_to = [(parent_id, 0, 1)] + list(paths_to)
+    if any(ancestor_id == child_id for ancestor_id, d, n in paths_to):
+        raise RelationCycleError(
+            "PID {0} cannot be a child of its descendant {1}.".format(
+                child_id, parent_id))
+    paths_from = [(child_id, 0, 1)] + list(paths_from)
+    paths = Counter()
+    for ancestor_id, depth_to, count_to in paths_to:
+        for descendant_id, depth_from, count_from in paths_from:
+            paths[(ancestor_id, descendant_id,
+                   depth_to + 1 + depth_from)] += count_to * count_from
+    return paths
+
+
+def _update_closure(connection, parent_id, child_id, relation_type, sign):
+    """Add (or remove) the paths of a relation to the closure table."""
+    c = closure_table
+    paths_to = connection.execute(
+        select([c.c.ancestor_id, c.c.depth, c.c.paths]).where(and_(
+            c.c.descendant_id == parent_id,
+            c.c.relation_type == relation_type))).fetchall()
+    paths_from = connection.execute(
+        select([c.c.descendant_id, c.c.depth, c.c.paths]).where(and_(
+            c.c.ancestor_id == child_id,
+            c.c.relation_type == relation_type))).fetchall()
+    paths = _relation_paths(parent_id, child_id, paths_to, paths_from)
+
+    ancestor_ids = set(a for a, d, depth in paths)
+    descendant_ids = set(d for a, d, depth in paths)
+    scope = and_(c.c.relation_type == relation_type,
+                 c.c.ancestor_id.in_(ancestor_ids),
+                 c.c.descendant_id.in_(descendant_ids))
+    existing = set(tuple(row) for row in connection.execute(
+        select([c.c.ancestor_id, c.c.descendant_id, c.c.depth]).where(
+            scope)))
+    updates = [dict(b_ancestor_id=a, b_descendant_id=d, b_depth=depth,
+                    b_paths=sign * count)
+               for (a, d, depth), count in paths.items()
+               if (a, d, depth) in existing]
+    if updates:
+        connection.execute(c.update().where(and_(
+            c.c.ancestor_id == bindparam('b_ancestor_id'),
+            c.c.descendant_id == bindparam('b_descendant_id'),
+            c.c.relation_type == relation_type,
+            c.c.depth == bindparam('b_depth'),
+        )).values(paths=c.c.paths + bindparam('b_paths')), updates)
+    if sign > 0:
+        inserts = [dict(ancestor_id=a, descendant_id=d, depth=depth,
+                        relation_type=relation_type, paths=count)
+                   for (a, d, depth), count in paths.items()
+                   if (a, d, depth) not in existing]
+        if inserts:
+            connection.execute(c.insert(), inserts)
+    else:
+        connection.execute(c.delete().where(and_(scope, c.c.paths <= 0)))
+
+
+def add_relation_closure(connection, parent_id, child_id, relation_type):
+    """Add the paths of a new relation to the closure table.
+
+    Does nothing if the closure of the relation type is not maintained.
+
+    :raises RelationCycleError: If the child is an ancestor of the parent.
+    """
+    if relation_type in closure_relation_types():
+        _update_closure(connection, parent_id, child_id, relation_type, 1)
+
+
+def remove_relation_closure(connection, parent_id, child_id, relation_type):
+    """Remove the paths of a removed relation from the closure table.
+
+    Does nothing if the closure of the relation type is not maintained.
+    """
+    if relation_type in closure_relation_types():
+        _update_closure(connection, parent_id, child_id, relation_type, -1)
+
+
+def _creates_cycle(connection, parent_id, child_id, relation_type):
+    """Determine if the child is the parent or one of its ancestors."""
+    if parent_id == child_id:
+        return True
+    r = PIDRelation.__table__
+    # Children are usually leaves, e.g. the new versions of a record
+    if connection.execute(select([r.c.child_id]).where(and_(
+            r.c.parent_id == child_id,
+            r.c.relation_type == relation_type)).limit(1)).first() is None:
+        return False
+    return _is_ancestor(connection, parent_id, child_id, relation_type)
+
+
+def _is_ancestor(connection, parent_id, child_id, relation_type):
+    """Determine if the child is one of the ancestors of the parent."""
+    r = PIDRelation.__table__
+    if relation_type in closure_relation_types():
+        c = closure_table
+        query = select([c.c.ancestor_id]).where(and_(
+            c.c.ancestor_id == child_id, c.c.descendant_id == parent_id,
+            c.c.relation_type == relation_type))
+    else:
+        # UNION drops the PIDs already reached, so that the traversal ends
+        # even on relations with a cycle, and stops at the first match.
+        ancestors = select([r.c.parent_id.label('pid_id')]).where(and_(
+            r.c.child_id == parent_id, r.c.relation_type == relation_type,
+        )).cte('ancestors', recursive=True)
+        hop = r.alias('hop')
+        ancestors = ancestors.union(select([hop.c.parent_id]).where(and_(
+            hop.c.child_id == ancestors.c.pid_id,
+            hop.c.relation_type == relation_type)))
+        query = select([ancestors.c.pid_id]).where(
+            ancestors.c.pid_id == child_id)
+    return connection.execute(query.limit(1)).first() is not None
+
+
+def check_relation_cycle(connection, parent_id, child_id, relation_type):
+    """Check that a relation does not close a cycle.
+
+    Does nothing if the cycles of the relation type are not prevented. The
+    check ends right away if the child has no children, otherwise the
+    ancestors of the parent are looked up in the closure table if it is
+    maintained, or traversed until the child is reached.
+
+    :raises RelationCycleError: If the child is an ancestor of the parent.
+    """
+    if relation_type in acyclic_relation_types() and _creates_cycle(
+            connection, parent_id, child_id, relation_type):
+        raise RelationCycleError(
+            "PID {0} cannot be a child of its descendant {1}.".format(
+                child_id, parent_id))
+
+
+def check_relation_cycles(connection, relations):
+    """Check that many relations do not close a cycle.
+
+    Same check as :func:`check_relation_cycle`, but the children which have
+    no children are found with a single query, thus only the other children
+    require a lookup of the ancestors of their parent.
+
+    :param relations: Iterable of ``(parent_id, child_id, relation_type)``
+        tuples.
+    :raises RelationCycleError: If a child is an ancestor of its parent.
+    """
+    acyclic_types = acyclic_relation_types()
+    relations = [(parent_id, child_id, relation_type)
+                 for parent_id, child_id, relation_type in relations
+                 if relation_type in acyclic_types]
+    if not relations:
+        return
+    r = PIDRelation.__table__
+    parents = set(tuple(row) for row in connection.execute(select([
+        r.c.parent_id, r.c.relation_type,
+    ]).where(r.c.parent_id.in_(set(c for p, c, t in relations))).distinct()))
+    for parent_id, child_id, relation_type in relations:
+        if parent_id == child_id or (
+                (child_id, relation_type) in parents and _is_ancestor(
+                    connection, parent_id, child_id, relation_type)):
+            raise RelationCycleError(
+                "PID {0} cannot be a child of its descendant {1}.".format(
+                    child_id, parent_id))
+
+
+def _compute_closure(relation_type):
+    """Compute the closure rows of the relations of a type in memory."""
+    paths = Counter()
+    paths_to = defaultdict(Counter)
+    paths_from = defaultdict(Counter)
+    relations = db.session.query(
+        PIDRelation.parent_id, PIDRelation.child_id).filter(
+            PIDRelation.relation_type == relation_type)
+    for parent_id, child_id in relations:
+        relation_paths = _relation_paths(
+            parent_id, child_id,
+            [(a, depth, n) for (a, depth), n in paths_to[parent_id].items()],
+            [(d, depth, n) for (d, depth), n in paths_from[child_id].items()])
+        for (a, d, depth), count in relation_paths.items():
+            paths[(a, d, depth)] += count
+            paths_to[d][(a, depth)] += count
+            paths_from[a][(d, depth)] += count
+    return paths
+
+
+def rebuild_closure(relation_type=None, chunk_size=1000):
+    """Rebuild the closure table from the relations.
+
+    :param relation_type: Rebuild only the closure of this relation type id
+        (by default all the maintained relation types).
+    :raises RelationCycleError: If the relations contain a cycle.
+    """
+    relation_types = closure_relation_types() if relation_type is None \
+        else [relation_type]
+    for type_id in relation_types:
+        db.session.execute(closure_table.delete().where(
+            closure_table.c.relation_type == type_id))
+        rows = [dict(ancestor_id=a, descendant_id=d, depth=depth,
+                     relation_type=type_id, paths=count)
+                for (a, d, depth), count in
+                sorted(_compute_closure(type_id).items())]
+        for idx in range(0, len(rows), chunk_size):
+            db.session.execute(
+                closure_table.insert(), rows[idx:idx + chunk_size])
+
+
+def check_closure(relation_type=None):
+    """Check the closure table against the relations.
+
+    :param relation_type: Check only the closure of this relation type id
+        (by default all the maintained relation types).
+    :returns: List of :class:`ClosureMismatch`, empty if the closure table
+        is consistent.
+    """
+    relation_types = closure_relation_types() if relation_type is None \
+        else [relation_type]
+    mismatches = []
+    for type_id in relation_types:
+        expected = _compute_closure(type_id)
+        c = closure_table
+        actual = dict(((a, d, depth), n) for a, d, depth, n in
+                      db.session.execute(select([
+                          c.c.ancestor_id, c.c.descendant_id, c.c.depth,
+                          c.c.paths]).where(c.c.relation_type == type_id)))
+        for key in sorted(set(expected) | set(actual)):
+            if expected.get(key) != actual.get(key):
+                a, d, depth = key
+                mismatches.append(ClosureMismatch(
+                    a, d, type_id, depth, expected.get(key),
+                    actual.get(key)))
+    return mismatches
+
+
+@event.listens_for(PIDRelation, 'after_insert')
+def _add_closure_on_insert(mapper, connection, target):
+    """Reject the cycles and add the paths of the relations created."""
+    check_relation_cycle(connection, target.parent_id, target.child_id,
+                         target.relation_type)
+    add_relation_closure(connection, target.parent_id, target.child_id,
+                         target.relation_type)
+
+
+@event.listens_for(PIDRelation, 'after_delete')
+def _remove_closure_on_delete(mapper, connection, target):
+    """Remove the paths of the relations deleted with the ORM."""
+    remove_relation_closure(connection, target.parent_id, target.child_id,
+                            target.relation_type)
+
+
+@event.listens_for(PIDRelation, 'after_update')
+def _update_closure_on_update(mapper, connection, target):
+    """Move the paths of the relations whose ends or type changed."""
+    old = {}
+    for key in ('parent_id', 'child_id', 'relation_type'):
+        history = get_history(target, key)
+        if history.deleted:
+            old[key] = history.deleted[0]
+    if old:
+        remove_relation_closure(
+            connection, old.get('parent_id', target.parent_id),
+            old.get('child_id', target.child_id),
+            old.get('relation_type', target.relation_type))
+        check_relation_cycle(connection, target.parent_id, target.child_id,
+                             target.relation_type)
+        add_relation_closure(connection, target.parent_id, target.child_id,
+                             target.relation_type)
+
+
+__all__ = (
+    'ClosureMismatch',
+    'RelationCycleError',
+    'add_relation_closure',
+    'check_closure',
+    'check_relation_cycle',
+    'check_relation_cycles',
+    'rebuild_closure',
+    'remove_relation_closure',
+)
@@ -100,3 +100,84 @@ PIDRELATIONS_INDEXED_RELATIONS = dict(
     )
 )
 """Default PID fetcher."""
+
+PIDRELATIONS_INDEX_GAPS = {}
+"""Sparse ordering gaps per relation type name, e.g. ``{'version': 1024}``.
+
+Children of the listed relation types are stored with gaps between their
+indices, so that inserting or removing a child does not renumber its
+siblings. The indices exposed by the API stay dense.
+"""
+
+PIDRELATIONS_CACHE_BACKEND = None
+"""Backend of the shared cache of serialized relations.
+
+Import path, factory or instance of a Redis-like client, e.g.
+``'invenio_pidrelations.cache:InMemoryBackend'`` or
+``lambda: redis.StrictRedis.from_url('redis://localhost:6379/0')``. The
+cache is disabled if None.
+"""
+
+PIDRELATIONS_CACHE_TTL = 24 * 60 * 60
+"""Expiration time of the cached serialized relations in seconds."""
+
+PIDRELATIONS_INDEX_QUEUE_BACKEND = None
+"""Backend of the queue of sibling records to index.
+
+Import path, factory or instance of a Redis-like client (see
+``PIDRELATIONS_CACHE_BACKEND``). If None, the siblings queued for indexing
+are sent for bulk indexing right away.
+"""
+
+PIDRELATIONS_INDEX_QUEUE_WINDOW = 10
+"""Time in seconds during which the siblings queued for indexing are
+collected before being sent for bulk indexing."""
+
+PIDRELATIONS_INDEXER_CHUNK_SIZE = 500
+"""Number of records whose relations are prefetched at once when bulk
+indexing (see ``invenio_pidrelations.contrib.indexer.RelationsRecordIndexer``).
+"""
+
+PIDRELATIONS_CHILDREN_WINDOW_SIZE = 10
+"""Number of children serialized before and after the PID by the windowed
+serializers (see
+``invenio_pidrelations.serializers.schemas.WindowedRelationSchema``).
+"""
+
+PIDRELATIONS_LOCK_RETRIES = 10
+"""Number of retries when the lock of a concept is held by another
+transaction (see ``invenio_pidrelations.locks.lock_concept``)."""
+
+PIDRELATIONS_LOCK_RETRY_DELAY = 0.05
+"""Delay in seconds before the first retry to lock a concept, doubled on
+each retry (up to 32 times)."""
+
+PIDRELATIONS_LOCK_CONCEPTS = True
+"""Lock the concepts while modifying their children.
+
+If disabled, concurrent modifications of a concept are only detected with
+its revision, and retried (see ``PIDRELATIONS_CONFLICT_RETRIES``).
+"""
+
+PIDRELATIONS_CONFLICT_RETRIES = 3
+"""Number of retries of a modification of a concept which was modified
+concurrently (see ``invenio_pidrelations.locks.retry_on_conflict``)."""
+
+PIDRELATIONS_CLOSURE_RELATION_TYPES = []
+"""Names of the relation types whose transitive closure is maintained.
+
+The descendants and ancestors of a PID in these relation types are then
+read from the closure table (see ``invenio_pidrelations.closure``).
+Enabling a relation type requires to rebuild its closure with
+``pidrelations rebuild-closure``.
+"""
+
+PIDRELATIONS_ACYCLIC_RELATION_TYPES = [
+    'ordered', 'unordered', 'version', 'record_draft']
+"""Names of the relation types in which cycles are prevented.
+
+Creating a relation which would make a PID its own ancestor raises
+``invenio_pidrelations.closure.RelationCycleError``. The relation
+types whose closure is maintained never allow cycles. Names which are not
+in ``PIDRELATIONS_RELATION_TYPES`` are ignored.
+"""
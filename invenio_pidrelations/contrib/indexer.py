@@ -0,0 +1,62 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Indexer integration for PIDRelations."""
+
+from __future__ import absolute_import, print_function
+
+from itertools import islice
+
+from flask import current_app
+from invenio_indexer.api import RecordIndexer
+
+from ..indexers import prefetched_relations
+
+
+class RelationsRecordIndexer(RecordIndexer):
+    """Record indexer prefetching the relations of bulk indexed records.
+
+    The relations of each chunk of records read from the bulk indexing queue
+    are prefetched (see
+    :func:`invenio_pidrelations.indexers.prefetched_relations`) before the
+    records are indexed.
+    """
+
+    def _actionsiter(self, message_iterator):
+        """Iterate bulk actions, one chunk of messages at a time.
+
+        :param message_iterator: Iterator yielding messages from a queue.
+        """
+        chunk_size = current_app.config['PIDRELATIONS_INDEXER_CHUNK_SIZE']
+        message_iterator = iter(message_iterator)
+        while True:
+            chunk = list(islice(message_iterator, chunk_size))
+            if not chunk:
+                break
+            record_ids = [m.decode()['id'] for m in chunk
+                          if m.decode()['op'] != 'delete']
+            with prefetched_relations(record_ids):
+                for action in super(
+                        RelationsRecordIndexer, self)._actionsiter(chunk):
+                    yield action
@@ -33,6 +33,7 @@ from invenio_records_files.models import RecordsBuckets
 
 from ..api import PIDConcept
 from ..contrib.versioning import PIDVersioning
+from ..models import PIDRelation
 from ..proxies import current_pidrelations
 from ..utils import resolve_relation_type_config
 
@@ -99,8 +100,11 @@ class RecordDraft(PIDConcept):
     possess "soft" links to their records' PIDs through metadata.
     """
 
+    relation_type_name = 'record_draft'
+
     def __init__(self, child=None, parent=None, relation=None):
-        self.relation_type = resolve_relation_type_config('record_draft').id
+        self.relation_type = resolve_relation_type_config(
+            self.relation_type_name).id
         if relation is not None:
             if relation.relation_type != self.relation_type:
                 raise ValueError('Provided PID relation ({0}) is not a '
@@ -163,17 +167,123 @@ def clone_record_files(src_record, dst_record):
     dst_record['_buckets'] = {'deposit': str(snapshot.id)}
 
 
-def index_siblings(pid, only_neighbors=False):
-    """Send sibling records of the passed pid for indexing."""
-    siblings = (PIDVersioning(child=pid).children.all())
+def _neighbor_siblings(pid):
+    """Get the previous and next siblings of a versioned PID."""
+    api = PIDVersioning(child=pid)
+    if api.relation is None or api.relation.index is None:
+        return []
+    children = api.children.order_by(None)
+    previous = children.filter(
+        PIDRelation.index < api.relation.index).order_by(
+            PIDRelation.index.desc()).first()
+    next_ = children.filter(
+        PIDRelation.index > api.relation.index).order_by(
+            PIDRelation.index.asc()).first()
+    return [p for p in (previous, next_) if p is not None]
+
 
-    index_pids = siblings
+def _siblings_record_ids(pid, only_neighbors=False):
+    """Get the record ids of the siblings to index (see `index_siblings`)."""
     if only_neighbors:
-        pid_index = siblings.index(pid)
-        index_pids = siblings[(pid_index - 1):(pid_index + 2)]
-    for p in index_pids:
-        if p != pid:
-            RecordIndexer().index_by_id(str(p.object_uuid))
-
-    # RecordIndexer().bulk_index([str(p.object_uuid)
-    #                             for p in index_pids if p != pid])
+        siblings = _neighbor_siblings(pid)
+    else:
+        siblings = PIDVersioning(child=pid).children_records
+    return (str(p.object_uuid) for p in siblings
+            if p.id != pid.id and p.object_uuid)
+
+
+def index_siblings(pid, only_neighbors=False, bulk=False):
+    """Send sibling records of the passed pid for indexing.
+
+    :param pid: Versioned PID whose relations were modified.
+    :param only_neighbors: Index only the siblings whose serialized relations
+        changed with the position of ``pid``, i.e. its previous and next
+        versions. For a new latest version, this is only the previous latest
+        version.
+    :param bulk: Send the siblings to the bulk indexing queue in one batch
+        (see :meth:`invenio_indexer.api.RecordIndexer.bulk_index`) instead of
+        indexing them one by one.
+    """
+    record_ids = _siblings_record_ids(pid, only_neighbors=only_neighbors)
+    indexer = RecordIndexer()
+    if bulk:
+        indexer.bulk_index(record_ids)
+    else:
+        for record_id in record_ids:
+            indexer.index_by_id(record_id)
+
+
+def queue_index_siblings(pid, only_neighbors=False):
+    """Queue the siblings of the passed pid for a debounced bulk indexing.
+
+    Falls back to :func:`index_siblings` in bulk mode if the queue is not
+    enabled (see ``PIDRELATIONS_INDEX_QUEUE_BACKEND``).
+    """
+    queue = current_pidrelations.siblings_index_queue
+    if queue is None:
+        index_siblings(pid, only_neighbors=only_neighbors, bulk=True)
+    else:
+        queue.enqueue(pid, only_neighbors=only_neighbors)
+
+
+class SiblingsIndexQueue(object):
+    """Coalescing queue of sibling records to index, per concept.
+
+    The records to index are collected into a set per concept (parent PID).
+    The first record queued for a concept schedules a task which, once the
+    time window has passed, sends the whole set for bulk indexing. The
+    siblings queued again and again during the window, e.g. by an import
+    creating many versions of the same concept, are thus indexed only once.
+    """
+
+    def __init__(self, backend, prefix='pidrelations', window=10):
+        """Initialize the queue.
+
+        :param backend: Redis-like client (see
+            :class:`invenio_pidrelations.cache.InMemoryBackend`).
+        :param prefix: Prefix of all the keys.
+        :param window: Time in seconds during which the records queued for
+            a concept are collected before being indexed.
+        """
+        self.backend = backend
+        self.prefix = prefix
+        self.window = window
+
+    def _records_key(self, concept_id):
+        return '{0}:index:{1}'.format(self.prefix, concept_id)
+
+    def _scheduled_key(self, concept_id):
+        return '{0}:index-scheduled:{1}'.format(self.prefix, concept_id)
+
+    def enqueue(self, pid, only_neighbors=False):
+        """Queue the siblings of a versioned PID for indexing."""
+        # NOTE: Celery is only required once the queue is enabled
+        from ..tasks import index_queued_siblings
+        parent = PIDVersioning(child=pid).parent
+        if parent is None:
+            return
+        record_ids = list(_siblings_record_ids(
+            pid, only_neighbors=only_neighbors))
+        if not record_ids:
+            return
+        self.backend.sadd(self._records_key(parent.id), *record_ids)
+        # The mark expires in case the scheduled task is lost
+        if self.backend.set(self._scheduled_key(parent.id), 1,
+                            ex=self.window + 3600, nx=True):
+            index_queued_siblings.apply_async(
+                args=(parent.id, ), countdown=self.window)
+
+    def pop(self, concept_id, batch_size=1000):
+        """Remove and return the record ids queued for a concept."""
+        # Unmark first, so that records queued from now on are not missed
+        self.backend.delete(self._scheduled_key(concept_id))
+        record_ids = []
+        while True:
+            batch = self.backend.spop(
+                self._records_key(concept_id), batch_size)
+            if not batch:
+                break
+            record_ids.extend(
+                r.decode('utf-8') if isinstance(r, bytes) else r
+                for r in batch)
+        return record_ids
@@ -30,7 +30,9 @@ from flask import current_app, Blueprint
 from invenio_db import db
 from invenio_pidstore.models import PersistentIdentifier, PIDStatus
 
-from ..api import PIDConceptOrdered
+from ..api import PIDConceptOrdered, PrefetchedChildren
+from ..cache import clear_concept_cache
+from ..locks import retry_on_conflict
 from ..models import PIDRelation
 from ..utils import resolve_relation_type_config
 
@@ -43,10 +45,13 @@ class PIDVersioning(PIDConceptOrdered):
         when calling 'insert'.
     """
 
+    relation_type_name = 'version'
+
     def __init__(self, child=None, parent=None, draft_deposit=None,
                  draft_record=None, relation=None):
         """Create a PID versioning API."""
-        self.relation_type = resolve_relation_type_config('version').id
+        self.relation_type = resolve_relation_type_config(
+            self.relation_type_name).id
         if relation is not None:
             if relation.relation_type != self.relation_type:
                 raise ValueError("Provided PID relation ({0}) is not a "
@@ -56,12 +61,8 @@ class PIDVersioning(PIDConceptOrdered):
             super(PIDVersioning, self).__init__(
                 child=child, parent=parent, relation_type=self.relation_type,
                 relation=relation)
-        if self.child:
-            self.relation = PIDRelation.query.filter(
-                PIDRelation.child_id == self.child.id,
-                PIDRelation.relation_type == self.relation_type,
-            ).one_or_none()
 
+    @retry_on_conflict
     def insert_child(self, child, index=-1):
         """Insert child into versioning scheme.
 
@@ -74,10 +75,29 @@ class PIDVersioning(PIDConceptOrdered):
             raise ValueError(
                 "Incorrect value for child index: {0}".format(index))
 
+        self.lock()
         with db.session.begin_nested():
             super(PIDVersioning, self).insert_child(child, index=index)
             self.parent.redirect(child)
 
+    @retry_on_conflict
+    def insert_children(self, children, index=-1):
+        """Insert many children into versioning scheme at once.
+
+        The parent is redirected only once, to the last inserted child.
+        """
+        if index is None:
+            raise ValueError(
+                "Incorrect value for child index: {0}".format(index))
+        children = list(children)
+        if not children:
+            return
+        self.lock()
+        with db.session.begin_nested():
+            super(PIDVersioning, self).insert_children(children, index=index)
+            self.parent.redirect(children[-1])
+
+    @retry_on_conflict
     def remove_child(self, child):
         """Remove a child from a versioning scheme.
 
@@ -85,6 +105,7 @@ class PIDVersioning(PIDConceptOrdered):
         adding a redirection from the parent to the last child.
         """
         # TODO: Add support for removing a single child
+        self.lock()
         if self.children.count() == 1:
             raise Exception("Removing single child is not supported.")
         with db.session.begin_nested():
@@ -106,37 +127,68 @@ class PIDVersioning(PIDConceptOrdered):
             status=status)
         self.relation = PIDRelation.create(
             self.parent, self.child, self.relation_type, 0)
+        self.update_head()
+        clear_concept_cache()
         if redirect:
             self.parent.redirect(self.child)
 
-    @property
-    def last_child(self):
-        """
-        Get the latest PID as pointed by the Head PID.
+    def _get_last_child(self, pid_status=PIDStatus.REGISTERED):
+        """Query the last registered child of the parent."""
+        return super(PIDVersioning, self)._get_last_child(
+            pid_status=pid_status)
+
+    def _get_last_child_record(self, pid_status=PIDStatus.REGISTERED):
+        """Query the last registered child of the parent as a record."""
+        return super(PIDVersioning, self)._get_last_child_record(
+            pid_status=pid_status)
 
-        If the 'pid' is a Head PID, return the latest of its children.
-        If the 'pid' is a Version PID, return the latest of its siblings.
-        Return None for the non-versioned PIDs.
+    @classmethod
+    def load_many(cls, pids):
+        """Load the versioning concepts of many PIDs at once.
+
+        See :meth:`invenio_pidrelations.api.PIDConcept.bulk`.
         """
-        return self.get_children(ordered=False,
-                                 pid_status=PIDStatus.REGISTERED).filter(
-                PIDRelation.index.isnot(None)).order_by(
-                    PIDRelation.index.desc()).first()
+        return cls.bulk(
+            pids, resolve_relation_type_config(cls.relation_type_name).id)
 
     @property
     def draft_child(self):
         """Get the last non-registered child"""
+        if self._prefetched is not None:
+            return PrefetchedChildren(
+                pid for relation, pid in self._prefetched
+                if relation.index is not None and
+                pid.status != PIDStatus.REGISTERED).one_or_none()
         return self.get_children(ordered=False).filter(
                 PIDRelation.index.isnot(None),
                 PersistentIdentifier.status != PIDStatus.REGISTERED).order_by(
                     PIDRelation.index.desc()).one_or_none()
 
+    @property
+    def draft_child_record(self):
+        """Get the last non-registered child as a read-only record."""
+        if self._prefetched is not None:
+            records = [r for r in self._prefetched_records()
+                       if r.index is not None and
+                       r.status != PIDStatus.REGISTERED]
+        else:
+            relations = self._positioned_relations(
+                *self._children_filters())
+            records = self._execute_records(self._select_records(
+                relations, relations.c.child_id == PersistentIdentifier.id,
+                relations.c.index.isnot(None),
+                PersistentIdentifier.status != PIDStatus.REGISTERED,
+            ).order_by(relations.c.index.desc()))
+        return PrefetchedChildren(records).one_or_none()
+
     @property
     def draft_child_deposit(self):
         from invenio_pidrelations.contrib.records import RecordDraft
         return RecordDraft.get_draft(self.draft_child)
 
+    @retry_on_conflict
     def insert_draft_child(self, child):
+        self.lock()
         if not self.draft_child:
             with db.session.begin_nested():
                 super(PIDVersioning, self).insert_child(child, index=-1)
@@ -145,13 +197,19 @@ class PIDVersioning(PIDConceptOrdered):
                 "Draft child already exists for this relation: {0}".format(
                     self.draft_child))
 
+    @retry_on_conflict
     def remove_draft_child(self):
+        self.lock()
         if self.draft_child:
             with db.session.begin_nested():
                 super(PIDVersioning, self).remove_child(self.draft_child,
                                                         reorder=True)
 
+    @retry_on_conflict
     def update_redirect(self):
+        # The status of the children might have changed since the last update
+        self.update_head()
+        clear_concept_cache()
         if self.last_child:
             if self.parent.status == PIDStatus.RESERVED:
                 self.parent.register()
@@ -162,6 +220,11 @@ class PIDVersioning(PIDConceptOrdered):
         """Children of the parent."""
         return self.get_children(pid_status=PIDStatus.REGISTERED, ordered=True)
 
+    @property
+    def children_records(self):
+        """Children of the parent as read-only records."""
+        return self.get_children_records(pid_status=PIDStatus.REGISTERED)
+
 
 versioning_blueprint = Blueprint(
     'invenio_pidrelations.versioning',
@@ -173,29 +236,30 @@ versioning_blueprint = Blueprint(
 @versioning_blueprint.app_template_filter()
 def pid_version_parent(child):
     """Get head PID of a PID."""
-    return PIDVersioning(child=child).parent
+    return PIDVersioning.load(child=child).parent
 
 
 @versioning_blueprint.app_template_test()
 def latest_version(child_pid=None, parent_pid=None):
     """Determine if PID is the last version."""
     assert child_pid or parent_pid
-    return PIDVersioning(child=child_pid, parent=parent_pid).last_child
+    if parent_pid:
+        return PIDVersioning.load(parent=parent_pid).last_child
+    return PIDVersioning.load(child=child_pid).last_child
 
 
 @versioning_blueprint.app_template_filter()
 def pid_versions(pid):
     """Get all versions of a PID."""
-    return PIDVersioning(child=pid).children
+    return PIDVersioning.load(child=pid).children
 
 
 @versioning_blueprint.app_template_filter()
 def to_versioning_api(pid, child=True):
     """Get PIDVersioning object."""
-    return PIDVersioning(
-        child=pid if child else None,
-        parent=pid if not child else None
-    )
+    if child:
+        return PIDVersioning.load(child=pid)
+    return PIDVersioning.load(parent=pid)
 
 
 __all__ = (
@@ -26,10 +26,16 @@
 
 from __future__ import absolute_import, print_function
 
+from copy import deepcopy
+
+import six
+from werkzeug.datastructures import ImmutableDict
 from werkzeug.utils import cached_property
 
 from . import config
+from .cache import RelationsCache
 from .indexers import index_relations
+from .utils import obj_or_import_string
 
 
 class _InvenioPIDRelationsState(object):
@@ -38,24 +44,113 @@ class _InvenioPIDRelationsState(object):
     def __init__(self, app):
         """Initialize state."""
         self.app = app
-
-    @cached_property
-    def relation_types(self):
-        return self.app.config.get('PIDRELATIONS_RELATION_TYPES', {})
+        self.load_relation_types()
+
+    def load_relation_types(self):
+        """Validate and index the configured relation types.
+
+        The relation types are indexed by id and by name. Their API and
+        schema classes are imported the first time they are resolved, so
+        that optional dependencies of unused relation types are not needed.
+        """
+        by_id = {}
+        by_name = {}
+        for relation_type in self.app.config.get(
+                'PIDRELATIONS_RELATION_TYPES', []):
+            if not isinstance(relation_type.id, int):
+                raise ValueError("Relation ID {0} is not an integer.".format(
+                    relation_type.id))
+            if not isinstance(relation_type.name, six.string_types):
+                raise ValueError("Relation name {0} is not a string.".format(
+                    relation_type.name))
+            if relation_type.id in by_id:
+                raise ValueError("Relation ID {0} is configured twice.".format(
+                    relation_type.id))
+            if relation_type.name in by_name:
+                raise ValueError(
+                    "Relation name '{0}' is configured twice.".format(
+                        relation_type.name))
+            by_id[relation_type.id] = relation_type
+            by_name[relation_type.name] = relation_type
+
+        indexed = deepcopy(
+            self.app.config.get('PIDRELATIONS_INDEXED_RELATIONS') or {})
+        for pid_type, conf in indexed.items():
+            if 'api' not in conf:
+                raise ValueError("Indexed relations of '{0}' have no API "
+                                 "configured.".format(pid_type))
+
+        self.relation_types = tuple(by_id.values())
+        self.relation_types_by_id = ImmutableDict(by_id)
+        self.relation_types_by_name = ImmutableDict(by_name)
+        self._indexed_relations = indexed
+        self._resolved = {}
+        self.__dict__.pop('indexed_relations', None)
+
+    def resolve_relation_type(self, value):
+        """Resolve a relation type id or name to its config object.
+
+        :param value: Relation type name (e.g. in serialization) or id (as
+            stored in the database).
+        :returns: The :class:`invenio_pidrelations.config.RelationType` with
+            imported API and schema classes.
+        """
+        if isinstance(value, six.string_types):
+            relation_type = self.relation_types_by_name.get(value)
+            if relation_type is None:
+                raise ValueError(
+                    "Relation name '{0}' is not configured.".format(value))
+        elif isinstance(value, int):
+            relation_type = self.relation_types_by_id.get(value)
+            if relation_type is None:
+                raise ValueError(
+                    "Relation ID {0} is not configured.".format(value))
+        else:
+            raise ValueError("Type of value '{0}' is not supported for "
+                             "resolving.".format(value))
+        resolved = self._resolved.get(relation_type.id)
+        if resolved is None:
+            resolved = relation_type._replace(
+                api=obj_or_import_string(relation_type.api),
+                schema=obj_or_import_string(relation_type.schema))
+            self._resolved[relation_type.id] = resolved
+        return resolved
 
     @cached_property
     def primary_pid_type(self):
         return self.app.config.get('PIDRELATIONS_PRIMARY_PID_TYPE')
 
+    @cached_property
+    def relations_cache(self):
+        """Cache of serialized relations (None if disabled)."""
+        backend = obj_or_import_string(
+            self.app.config.get('PIDRELATIONS_CACHE_BACKEND'))
+        if backend is None:
+            return None
+        return RelationsCache(
+            backend() if callable(backend) else backend,
+            ttl=self.app.config.get('PIDRELATIONS_CACHE_TTL'))
+
+    @cached_property
+    def siblings_index_queue(self):
+        """Queue of sibling records to index (None if disabled)."""
+        backend = obj_or_import_string(
+            self.app.config.get('PIDRELATIONS_INDEX_QUEUE_BACKEND'))
+        if backend is None:
+            return None
+        from .contrib.records import SiblingsIndexQueue
+        return SiblingsIndexQueue(
+            backend() if callable(backend) else backend,
+            window=self.app.config.get('PIDRELATIONS_INDEX_QUEUE_WINDOW'))
+
+    @cached_property
     def indexed_relations(self):
-        """Load the configuration for indexed relations."""
-        indexed = self.app.config.get('PIDRELATIONS_INDEXED_RELATIONS')
-        if not indexed:
-            return {}
-        result = deepcopy(indexed)
-        for pid_value, conf in result.items():
-            conf.update(dict(api=obj_or_import_string(conf['api'])))
-        return result
+        """Configuration of the indexed relations, per PID type."""
+        result = {}
+        for pid_type, conf in self._indexed_relations.items():
+            conf = dict(conf, api=obj_or_import_string(conf['api']))
+            result[pid_type] = ImmutableDict(conf)
+        return ImmutableDict(result)
 
 
 class InvenioPIDRelations(object):
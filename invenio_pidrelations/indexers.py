@@ -26,23 +26,57 @@
 
 from __future__ import absolute_import, print_function
 
+from contextlib import contextmanager
+
+from invenio_db import db
 from invenio_pidstore.models import PersistentIdentifier
 
 from .proxies import current_pidrelations
-from .serializers.utils import serialize_relations
+from .serializers.utils import serialize_relations, \
+    serialize_relations_many
+
+
+@contextmanager
+def prefetched_relations(record_ids):
+    """Prefetch the relations of many records for indexing.
+
+    The primary PIDs of the records and their relations are fetched and
+    serialized at once. While in the context, :func:`index_relations` reads
+    the relations of these records from the prefetched data.
+
+    :param record_ids: UUIDs of the records.
+    """
+    record_ids = [str(r) for r in record_ids]
+    prefetched = dict((r, None) for r in record_ids)
+    if record_ids:
+        pids = PersistentIdentifier.query.filter(
+            PersistentIdentifier.object_uuid.in_(record_ids),
+            PersistentIdentifier.pid_type ==
+            current_pidrelations.primary_pid_type,
+        ).all()
+        for pid, relations in serialize_relations_many(pids).items():
+            prefetched[str(pid.object_uuid)] = relations
+    db.session.info['pidrelations_prefetched'] = prefetched
+    try:
+        yield prefetched
+    finally:
+        db.session.info.pop('pidrelations_prefetched', None)
 
 
 def index_relations(sender, json=None, record=None, index=None, **kwargs):
     """Add relations to the indexed record."""
-    pid = PersistentIdentifier.query.filter(
-        PersistentIdentifier.object_uuid == record.id,
-        PersistentIdentifier.pid_type == current_pidrelations.primary_pid_type,
-        ).one_or_none()
-    relations = None
-    if pid:
-        relations = serialize_relations(pid)
-        if relations:
-            json['relations'] = relations
+    prefetched = db.session.info.get('pidrelations_prefetched', {})
+    if str(record.id) in prefetched:
+        relations = prefetched[str(record.id)]
+    else:
+        pid = PersistentIdentifier.query.filter(
+            PersistentIdentifier.object_uuid == record.id,
+            PersistentIdentifier.pid_type ==
+            current_pidrelations.primary_pid_type,
+            ).one_or_none()
+        relations = serialize_relations(pid) if pid else None
+    if relations:
+        json['relations'] = relations
     # pids = (PersistentIdentifier.query
     #         .filter(PersistentIdentifier.object_uuid == record.id)
     #         .all())
@@ -0,0 +1,183 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Locking of PID concepts against concurrent modifications."""
+
+from __future__ import absolute_import, print_function
+
+import threading
+import time
+import weakref
+from functools import wraps
+
+from flask import current_app
+from invenio_db import db
+from invenio_pidstore.models import PersistentIdentifier
+from sqlalchemy import event, inspect
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from sqlalchemy.orm.exc import StaleDataError
+
+
+class ConceptLockedError(Exception):
+    """The lock of a concept could not be acquired in time."""
+
+
+class ConceptConflictError(Exception):
+    """A concept was modified concurrently by another transaction."""
+
+
+_app_locks = weakref.WeakValueDictionary()
+"""Process-local locks of the concepts, keyed by parent PID id.
+
+A lock is dropped once no transaction holds it or waits for it.
+"""
+
+_app_locks_lock = threading.Lock()
+
+
+def _app_lock(parent_id):
+    """Get the process-local lock of a concept."""
+    with _app_locks_lock:
+        lock = _app_locks.get(parent_id)
+        if lock is None:
+            # NOTE: Unlike plain locks, semaphores can be weakly referenced
+            lock = _app_locks[parent_id] = threading.BoundedSemaphore()
+        return lock
+
+
+def _try_row_lock(parent_id):
+    """Try to lock the row of the parent PID without waiting."""
+    try:
+        with db.session.begin_nested():
+            db.session.query(PersistentIdentifier.id).filter(
+                PersistentIdentifier.id == parent_id).with_for_update(
+                    nowait=True).scalar()
+        return True
+    except OperationalError:
+        return False
+
+
+def lock_concept(parent):
+    """Lock a concept until the end of the current transaction.
+
+    Concurrent modifications of the children of a parent PID are thereby
+    serialized. The row of the parent PID is locked with
+    ``SELECT ... FOR UPDATE``, except on SQLite which does not support it:
+    a process-local lock is taken instead, which only protects against the
+    other threads of the process. As SQLite transactions lock the whole
+    database once they read, the lock has to be taken there before any
+    other statement of the transaction.
+
+    Locking a concept already locked by the session does nothing. The lock
+    is retried a bounded number of times (see ``PIDRELATIONS_LOCK_RETRIES``
+    and ``PIDRELATIONS_LOCK_RETRY_DELAY``).
+
+    :param parent: Parent PID of the concept.
+    :raises ConceptLockedError: If the lock could not be acquired.
+    """
+    session = db.session()
+    locked = session.info.setdefault('pidrelations_locks', {})
+    # NOTE: Do not refresh an expired parent, i.e. start reading
+    identity = inspect(parent).identity
+    parent_id = identity[0] if identity else parent.id
+    if parent_id in locked:
+        return
+    if session.bind.dialect.name == 'sqlite':
+        lock = _app_lock(parent_id)
+
+        def acquire():
+            return lock.acquire(False)
+    else:
+        lock = None
+
+        def acquire():
+            return _try_row_lock(parent_id)
+
+    retries = current_app.config['PIDRELATIONS_LOCK_RETRIES']
+    delay = current_app.config['PIDRELATIONS_LOCK_RETRY_DELAY']
+    for attempt in range(retries + 1):
+        if acquire():
+            locked[parent_id] = lock
+            return
+        if attempt < retries:
+            time.sleep(delay * 2 ** min(attempt, 5))
+    raise ConceptLockedError(
+        "Could not lock the concept of PID {0}.".format(parent_id))
+
+
+def retry_on_conflict(method):
+    """Retry a modification of a concept modified concurrently.
+
+    Decorates the methods of the concept API modifying the children of a
+    concept. The revision of the concept head is read first, and the head
+    is then updated with a compare-and-swap on it (see
+    :meth:`invenio_pidrelations.api.PIDConcept.update_head`). If another
+    transaction modified the concept in between, the modification is
+    rolled back and retried, up to ``PIDRELATIONS_CONFLICT_RETRIES`` times.
+
+    :raises ConceptConflictError: If the retries are exhausted.
+    """
+    @wraps(method)
+    def wrapper(self, *args, **kwargs):
+        session = db.session()
+        if session.info.get('pidrelations_retrying'):
+            return method(self, *args, **kwargs)
+        retries = current_app.config['PIDRELATIONS_CONFLICT_RETRIES']
+        session.info['pidrelations_retrying'] = True
+        try:
+            for attempt in range(retries + 1):
+                self.lock()
+                try:
+                    with db.session.begin_nested():
+                        # NOTE: Referenced to stay in the identity map with
+                        # the revision read before the modification
+                        head = self.head  # noqa: F841
+                        return method(self, *args, **kwargs)
+                except (StaleDataError, ConceptConflictError):
+                    if attempt == retries:
+                        raise ConceptConflictError(
+                            "The concept of PID {0} was modified "
+                            "concurrently.".format(self.parent.id))
+                    self._prefetched = None
+        finally:
+            session.info.pop('pidrelations_retrying', None)
+    return wrapper
+
+
+@event.listens_for(Session, 'after_transaction_end')
+def _release_on_transaction_end(session, transaction):
+    """Release the process-local locks once the transaction is over."""
+    if transaction.parent is None:
+        for lock in session.info.pop('pidrelations_locks', {}).values():
+            if lock is not None:
+                lock.release()
+
+
+__all__ = (
+    'ConceptConflictError',
+    'ConceptLockedError',
+    'lock_concept',
+    'retry_on_conflict',
+)
@@ -27,6 +27,7 @@
 from __future__ import absolute_import, print_function
 
 import logging
+from itertools import islice
 
 from flask_babelex import gettext
 from invenio_db import db
@@ -45,6 +46,11 @@ class PIDRelation(db.Model, Timestamp):
     """Model persistent identifier relations."""
 
     __tablename__ = 'pidrelations_pidrelation'
+    __table_args__ = (
+        db.Index('idx_pidrelations_child_type', 'child_id', 'relation_type'),
+        db.Index('idx_pidrelations_parent_type_index',
+                 'parent_id', 'relation_type', 'index'),
+    )
 
     parent_id = db.Column(
         db.Integer,
@@ -124,6 +130,85 @@ class PIDRelation(db.Model, Timestamp):
             # raise Exception(msg)
         return obj
 
+    @classmethod
+    def bulk_create(cls, rows, chunk_size=1000, check_cycles=True):
+        """Create many PID relations at once.
+
+        The relations are inserted in chunks, each one with a single
+        executemany INSERT and a single query for the existing relations,
+        instead of a savepoint per relation. The rows are consumed one chunk
+        at a time, so they can be streamed from a generator.
+
+        The existing denormalized concept heads of the parents are updated
+        in place once all relations are inserted, thus their revision keeps
+        increasing (see :func:`invenio_pidrelations.api.update_stale_heads`).
+        The heads of the new concepts are only created by the API or when
+        rebuilt (see :func:`invenio_pidrelations.api.rebuild_concept_heads`).
+        The closure table is updated relation by relation (see
+        :mod:`invenio_pidrelations.closure`), thus for a mass import it is
+        faster to rebuild it afterwards.
+
+        The cycles are checked with a single query per chunk for the
+        children which have no children, e.g. new versions, and with a
+        lookup of the ancestors of the parent for each other child. Relations
+        already known to be acyclic can skip the check.
+
+        :param rows: Iterable of ``(parent_id, child_id, relation_type,
+            index)`` tuples.
+        :param chunk_size: Number of relations inserted at once.
+        :param check_cycles: Check that the relations do not close a cycle
+            (see :func:`invenio_pidrelations.closure.check_relation_cycles`).
+        :returns: Number of created relations.
+        :raises invenio_pidrelations.closure.RelationCycleError: If a
+            relation closes a cycle in a relation type whose cycles are
+            prevented. The relations of the chunk are already inserted, thus
+            the transaction should be rolled back.
+        """
+        from .api import mark_heads_stale, update_stale_heads
+        from .cache import clear_concept_cache, mark_concepts_changed
+        from .closure import add_relation_closure, check_relation_cycles, \
+            closure_relation_types
+
+        # NOTE: Unlike ORM queries, statements are not autoflushed
+        db.session.flush()
+        closure_types = closure_relation_types()
+        rows = iter(rows)
+        count = 0
+        while True:
+            chunk = {}
+            for parent_id, child_id, relation_type, index in \
+                    islice(rows, chunk_size):
+                if (parent_id, child_id) in chunk:
+                    raise Exception("PID Relation already exists.")
+                chunk[(parent_id, child_id)] = dict(
+                    parent_id=parent_id, child_id=child_id,
+                    relation_type=relation_type, index=index)
+            if not chunk:
+                break
+            existing = db.session.query(cls.parent_id, cls.child_id).filter(
+                cls.child_id.in_(set(c for p, c in chunk)))
+            if any(tuple(key) in chunk for key in existing):
+                raise Exception("PID Relation already exists.")
+            db.session.execute(cls.__table__.insert(), list(chunk.values()))
+            if check_cycles:
+                check_relation_cycles(db.session.connection(), (
+                    (row['parent_id'], row['child_id'], row['relation_type'])
+                    for row in chunk.values()))
+            for row in chunk.values():
+                if row['relation_type'] in closure_types:
+                    add_relation_closure(
+                        db.session.connection(), row['parent_id'],
+                        row['child_id'], row['relation_type'])
+            mark_heads_stale(db.session, set(
+                (row['parent_id'], row['relation_type'])
+                for row in chunk.values()))
+            mark_concepts_changed(db.session, set(p for p, c in chunk))
+            count += len(chunk)
+        if count:
+            update_stale_heads(db.session)
+            clear_concept_cache()
+        return count
+
     @classmethod
     def relation_exists(self, parent, child, relation_type):
         """Determine if given relation already exists."""
@@ -133,6 +218,132 @@ class PIDRelation(db.Model, Timestamp):
             relation_type=relation_type).count() > 0
 
 
+class PIDConceptHead(db.Model, Timestamp):
+    """Denormalized head of a PID concept.
+
+    Stores the last child and the number of children of a parent PID in a
+    given relation type, so that they can be read with a primary key lookup.
+    The heads are maintained by the concept API (see
+    :class:`invenio_pidrelations.api.PIDConcept`). Relations modified
+    without the API require the heads to be rebuilt (see
+    :func:`invenio_pidrelations.api.rebuild_concept_heads`).
+    """
+
+    __tablename__ = 'pidrelations_concepthead'
+
+    parent_id = db.Column(
+        db.Integer,
+        db.ForeignKey(PersistentIdentifier.id, onupdate="CASCADE",
+                      ondelete="CASCADE"),
+        nullable=False,
+        primary_key=True)
+    """Parent PID of the concept."""
+
+    relation_type = db.Column(
+        db.SmallInteger(),
+        nullable=False,
+        primary_key=True)
+    """Type of relation of the concept."""
+
+    last_child_id = db.Column(
+        db.Integer,
+        db.ForeignKey(PersistentIdentifier.id, onupdate="CASCADE",
+                      ondelete="SET NULL"),
+        nullable=True)
+    """Last child PID of the concept."""
+
+    children_count = db.Column(db.Integer, nullable=False, default=0)
+    """Number of children of the concept."""
+
+    revision = db.Column(db.Integer, nullable=False, default=0,
+                         server_default='0')
+    """Revision of the concept, incremented on each modification.
+
+    Heads are updated with a compare-and-swap on the revision, so that
+    concurrent modifications of a concept are detected (see
+    :func:`invenio_pidrelations.locks.retry_on_conflict`).
+    """
+
+    __mapper_args__ = {
+        'version_id_col': revision,
+        'version_id_generator': lambda revision: (revision or 0) + 1,
+    }
+
+    #
+    # Relations
+    #
+    parent = db.relationship(
+        PersistentIdentifier,
+        primaryjoin=PersistentIdentifier.id == parent_id,
+        backref=backref('concept_heads', lazy='dynamic',
+                        cascade='all,delete'))
+
+    last_child = db.relationship(
+        PersistentIdentifier,
+        primaryjoin=PersistentIdentifier.id == last_child_id)
+
+    def __repr__(self):
+        """String representation of a PID concept head."""
+        return "<PIDConceptHead: {h.parent_id} (Type: {h.relation_type}, " \
+               "Last: {h.last_child_id}, Count: {h.children_count})>".format(
+                   h=self)
+
+
+class PIDRelationClosure(db.Model):
+    """Transitive closure of the PID relations of a type.
+
+    Stores the paths between each PID and its descendants in the relations
+    of a given type, so that all the descendants or ancestors of a PID can
+    be read with an indexed lookup. As a PID may be reached by several
+    paths, e.g. if it has several parents, the number of paths of each
+    length is counted. The closure is only maintained for the relation
+    types listed in ``PIDRELATIONS_CLOSURE_RELATION_TYPES`` (see
+    :mod:`invenio_pidrelations.closure`).
+    """
+
+    __tablename__ = 'pidrelations_closure'
+    __table_args__ = (
+        db.Index('idx_pidrelations_closure_descendant_type',
+                 'descendant_id', 'relation_type'),
+    )
+
+    ancestor_id = db.Column(
+        db.Integer,
+        db.ForeignKey(PersistentIdentifier.id, onupdate="CASCADE",
+                      ondelete="CASCADE"),
+        nullable=False,
+        primary_key=True)
+    """Ancestor PID of the path."""
+
+    descendant_id = db.Column(
+        db.Integer,
+        db.ForeignKey(PersistentIdentifier.id, onupdate="CASCADE",
+                      ondelete="CASCADE"),
+        nullable=False,
+        primary_key=True)
+    """Descendant PID of the path."""
+
+    relation_type = db.Column(
+        db.SmallInteger(),
+        nullable=False,
+        primary_key=True)
+    """Type of the relations of the path."""
+
+    depth = db.Column(db.Integer, nullable=False, primary_key=True)
+    """Number of relations of the path."""
+
+    paths = db.Column(db.Integer, nullable=False, default=1)
+    """Number of paths of this length between the two PIDs."""
+
+    def __repr__(self):
+        """String representation of a PID relation closure row."""
+        return "<PIDRelationClosure: {c.ancestor_id} -> {c.descendant_id} " \
+               "(Type: {c.relation_type}, Depth: {c.depth}, " \
+               "Paths: {c.paths})>".format(c=self)
+
+
 __all__ = (
+    'PIDConceptHead',
     'PIDRelation',
+    'PIDRelationClosure',
 )
@@ -24,6 +24,7 @@
 
 """PIDRelation JSON Schema for metadata."""
 
+from flask import current_app
 from marshmallow import Schema, fields
 
 from ..utils import resolve_relation_type_config
@@ -44,7 +45,7 @@ class RelationSchema(Schema):
     parent = fields.Method('dump_parent')
     children = fields.Method('dump_children')
     type = fields.Method('dump_type')
-    is_ordered = fields.Boolean()
+    is_ordered = fields.Method('dump_is_ordered')
     is_parent = fields.Method('_is_parent')
     is_child = fields.Method('_is_child')
     is_last = fields.Method('dump_is_last')
@@ -60,20 +61,33 @@ class RelationSchema(Schema):
         else:
             return None
 
+    def _neighbourhood(self, obj):
+        """Get the neighbourhood of the child, computed once per relation."""
+        cached = getattr(self, '_cached_neighbourhood', None)
+        if cached is None or cached[0] is not obj:
+            cached = (obj, obj.neighbourhood())
+            self._cached_neighbourhood = cached
+        return cached[1]
+
+    def dump_is_ordered(self, obj):
+        """Dump the boolean stating if the relation is ordered."""
+        return self._neighbourhood(obj).is_ordered
+
     def dump_next(self, obj):
         """Dump the parent of a PID."""
         if self._is_child(obj):
-            return self._dump_relative(obj.next)
+            return self._dump_relative(self._neighbourhood(obj).next)
 
     def dump_previous(self, obj):
         """Dump the parent of a PID."""
         if self._is_child(obj):
-            return self._dump_relative(obj.previous)
+            return self._dump_relative(self._neighbourhood(obj).previous)
 
     def dump_index(self, obj):
         """Dump the index of the child in the relation."""
-        if obj.is_ordered and self._is_child(obj):
-            return obj.index
+        neighbourhood = self._neighbourhood(obj)
+        if neighbourhood.is_ordered and self._is_child(obj):
+            return neighbourhood.index
         else:
             return None
 
@@ -89,9 +103,9 @@ class RelationSchema(Schema):
         """Dump the boolean stating if the child in the relation is last.
         Dumps `None` for parent serialization.
         """
-        if self._is_child(obj) and obj.is_ordered:
-            # TODO: This method exists in API
-            return obj.children.all()[-1] == self.context['pid']
+        neighbourhood = self._neighbourhood(obj)
+        if self._is_child(obj) and neighbourhood.is_ordered:
+            return neighbourhood.is_last
         else:
             return None
 
@@ -114,8 +128,49 @@ class RelationSchema(Schema):
 
     def dump_children(self, obj):
         """Dump the siblings of a PID."""
-        data, errors = PIDSchema(many=True).dump(obj.children.all())
-        return data
+        schema = PIDSchema()
+        return [schema.dump(child)[0] for child in obj.children_records]
+
+
+class WindowedRelationSchema(RelationSchema):
+    """PID relation schema embedding only a window of the children.
+
+    Instead of all the children, embeds the children around the PID (see
+    ``PIDRELATIONS_CHILDREN_WINDOW_SIZE``), the first and the last child and
+    the number of children. All the children remain available through
+    :meth:`invenio_pidrelations.api.PIDConcept.children_page`.
+    """
+
+    first_child = fields.Method('dump_first_child')
+    last_child = fields.Method('dump_last_child')
+    children_count = fields.Method('dump_children_count')
+
+    def _window(self, obj):
+        """Get the window of children, computed once per relation."""
+        cached = getattr(self, '_cached_window', None)
+        if cached is None or cached[0] is not obj:
+            size = current_app.config['PIDRELATIONS_CHILDREN_WINDOW_SIZE']
+            cached = (obj, obj.children_window(size))
+            self._cached_window = cached
+        return cached[1]
+
+    def dump_children(self, obj):
+        """Dump the children around the PID."""
+        schema = PIDSchema()
+        return [schema.dump(child)[0]
+                for child in self._window(obj).children]
+
+    def dump_first_child(self, obj):
+        """Dump the first child of the relation."""
+        return self._dump_relative(self._window(obj).first)
+
+    def dump_last_child(self, obj):
+        """Dump the last child of the relation."""
+        return self._dump_relative(self._window(obj).last)
+
+    def dump_children_count(self, obj):
+        """Dump the number of children of the relation."""
+        return self._window(obj).count
 
 
 class PIDRelationsMixin(object):
@@ -124,6 +179,14 @@ class PIDRelationsMixin(object):
     relations = fields.Method('dump_relations')
 
     def dump_relations(self, obj):
-        """Dump the relations to a dictionary."""
+        """Dump the relations to a dictionary.
+
+        The relations are taken from ``context['relations']`` if they were
+        serialized beforehand, e.g. for a list of records (see
+        :func:`.serialize_relations_many`).
+        """
         pid = self.context['pid']
+        prefetched = self.context.get('relations')
+        if prefetched is not None and pid in prefetched:
+            return prefetched[pid]
         return serialize_relations(pid)
@@ -24,24 +24,195 @@
 
 """PIDRelation serialization utilities."""
 
+from flask import current_app
+from invenio_db import db
+from marshmallow import Schema
+from sqlalchemy import and_, func
+
 from invenio_pidrelations.api import PIDRelation
 
+from ..cache import current_relations_cache
 from ..utils import resolve_relation_type_config
 
 
 def serialize_relations(pid):
-    """Serialize the relations for given PID."""
-    data = {}
+    """Serialize the relations for given PID.
+
+    The result is read from the shared relations cache when it is enabled
+    (see ``PIDRELATIONS_CACHE_BACKEND``).
+    """
+    cache = current_relations_cache()
+    if cache is None:
+        return _serialize_relations(pid)
+    parent_ids = PIDRelation.get_child_relations(pid).with_entities(
+        PIDRelation.parent_id)
+    stamps = cache.get_stamps(set([pid.id] + [p for p, in parent_ids]))
+    data = cache.get(pid.id, stamps)
+    if data is None:
+        data = _serialize_relations(pid)
+        cache.set(pid.id, stamps, data)
+    return data
+
+
+def serialize_relations_many(pids):
+    """Serialize the relations of many PIDs at once.
+
+    Same result as :func:`serialize_relations` for each PID, with a number
+    of queries which does not depend on the number of PIDs. The relations
+    are read from and stored in the shared relations cache when it is
+    enabled.
+
+    :param pids: PIDs to serialize the relations of.
+    :returns: Dictionary of the serialized relations, keyed by PID.
+    """
+    pids = list(pids)
+    cache = current_relations_cache()
+    if cache is None or not pids:
+        return _serialize_relations_many(pids)
+    concept_ids = dict((p.id, set([p.id])) for p in pids)
+    for child_id, parent_id in PIDRelation.query.filter(
+            PIDRelation.child_id.in_(list(concept_ids))).with_entities(
+                PIDRelation.child_id, PIDRelation.parent_id):
+        concept_ids[child_id].add(parent_id)
+    stamps = cache.get_stamps(set().union(*concept_ids.values()))
+    pid_stamps = [
+        (p.id, dict((c, stamps[c]) for c in concept_ids[p.id]))
+        for p in pids]
+
+    result = dict(zip(pids, cache.get_many(pid_stamps)))
+    missing = [p for p in pids if result[p] is None]
+    for pid, data in _serialize_relations_many(missing).items():
+        cache.set(pid.id, dict(pid_stamps)[pid.id], data)
+        result[pid] = data
+    return result
+
+
+def _serialize_relations(pid):
+    """Serialize the relations for given PID without caching."""
     relations = PIDRelation.get_child_relations(pid).all()
-    parent_relation = PIDRelation.get_parent_relations(pid).first()
+    parent_relation = PIDRelation.get_parent_relations(pid).order_by(
+        PIDRelation.child_id).first()
     if parent_relation:
         relations.append(parent_relation)
+    return _dump_relations(pid, [
+        resolve_relation_type_config(relation.relation_type).api(
+            relation=relation) for relation in relations])
+
+
+def _serialize_relations_many(pids):
+    """Serialize the relations of many PIDs without caching.
+
+    The relations and concepts of all the PIDs are fetched with a number of
+    queries which does not depend on the number of PIDs.
+
+    :returns: Dictionary of the serialized relations, keyed by PID.
+    """
+    pids = list(pids)
+    if not pids:
+        return {}
+    pid_ids = [p.id for p in pids]
+    relations = dict((p.id, []) for p in pids)
+    for relation in PIDRelation.query.filter(
+            PIDRelation.child_id.in_(pid_ids)):
+        relations[relation.child_id].append(relation)
+    # Same relation as 'get_parent_relations(pid).first()' for each parent
+    first_children = db.session.query(
+        PIDRelation.parent_id.label('parent_id'),
+        func.min(PIDRelation.child_id).label('child_id'),
+    ).filter(PIDRelation.parent_id.in_(pid_ids)).group_by(
+        PIDRelation.parent_id).subquery()
+    for relation in PIDRelation.query.join(first_children, and_(
+            PIDRelation.parent_id == first_children.c.parent_id,
+            PIDRelation.child_id == first_children.c.child_id)):
+        relations[relation.parent_id].append(relation)
+
+    by_type = {}
+    for pid_relations in relations.values():
+        for relation in pid_relations:
+            by_type.setdefault(relation.relation_type, []).append(relation)
+    concepts = {}
+    for relation_type, type_relations in by_type.items():
+        api_class = resolve_relation_type_config(relation_type).api
+        for relation, concept in zip(
+                type_relations, api_class.bulk_relations(type_relations)):
+            concepts[relation] = concept
 
-    for relation in relations:
-        rel_cfg = resolve_relation_type_config(relation.relation_type)
+    return dict((pid, _dump_relations(
+        pid, [concepts[r] for r in relations[pid.id]])) for pid in pids)
+
+
+def _dump_relations(pid, concepts):
+    """Dump the relation concepts of a PID with their schemas."""
+    data = {}
+    for concept in concepts:
+        rel_cfg = resolve_relation_type_config(concept.relation_type)
         schema_class = rel_cfg.schema
-        schema = schema_class()
-        schema.context['pid'] = pid
-        result, errors = schema.dump(rel_cfg.api(relation=relation))
+        if isinstance(schema_class, type) and \
+                issubclass(schema_class, Schema):
+            schema = schema_class()
+            schema.context['pid'] = pid
+            result, errors = schema.dump(concept)
+        else:
+            result = schema_class(concept, pid)
         data.setdefault(rel_cfg.name, []).append(result)
     return data
+
+
+def _dump_pid(pid):
+    """Dump a PID like :class:`.schemas.PIDSchema`."""
+    if not pid:
+        return None
+    return {'pid_type': pid.pid_type, 'pid_value': pid.pid_value}
+
+
+def dump_relation(concept, pid, children=True):
+    """Dump a relation concept of a PID without marshmallow.
+
+    Same result as :class:`.schemas.RelationSchema`, at a fraction of the
+    cost. It can be used instead of the schema class of a relation type in
+    ``PIDRELATIONS_RELATION_TYPES``, e.g.
+    ``RelationType(2, 'version', 'Version', '...:PIDVersioning',
+    'invenio_pidrelations.serializers.utils:dump_relation')``.
+
+    :param concept: Concept API object of the relation.
+    :param pid: PID whose relations are serialized.
+    :param children: Dump the children (otherwise left out).
+    """
+    neighbourhood = concept.neighbourhood()
+    is_child = concept.child == pid
+    is_ordered = neighbourhood.is_ordered
+    data = {
+        'parent': _dump_pid(concept.parent),
+        'type': resolve_relation_type_config(concept.relation_type).name,
+        'is_ordered': is_ordered,
+        'is_parent': concept.parent == pid,
+        'is_child': is_child,
+        'is_last': neighbourhood.is_last if is_child and is_ordered else None,
+        'index': neighbourhood.index if is_child and is_ordered else None,
+        'next': _dump_pid(neighbourhood.next) if is_child else None,
+        'previous': _dump_pid(neighbourhood.previous) if is_child else None,
+    }
+    if children:
+        data['children'] = [_dump_pid(c) for c in concept.children_records]
+    return data
+
+
+def dump_windowed_relation(concept, pid):
+    """Dump a relation concept of a PID without marshmallow.
+
+    Same result as :class:`.schemas.WindowedRelationSchema` (see
+    :func:`dump_relation`).
+
+    :param concept: Concept API object of the relation.
+    :param pid: PID whose relations are serialized.
+    """
+    data = dump_relation(concept, pid, children=False)
+    window = concept.children_window(
+        current_app.config['PIDRELATIONS_CHILDREN_WINDOW_SIZE'])
+    data.update({
+        'children': [_dump_pid(c) for c in window.children],
+        'first_child': _dump_pid(window.first),
+        'last_child': _dump_pid(window.last),
+        'children_count': window.count,
+    })
+    return data
@@ -0,0 +1,61 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Celery tasks for PID relations."""
+
+from __future__ import absolute_import, print_function
+
+from celery import shared_task
+
+from .proxies import current_pidrelations
+
+
+@shared_task(ignore_result=True)
+def process_bulk_queue(version_type=None):
+    """Process the bulk indexing queue, prefetching the relations.
+
+    Replaces :func:`invenio_indexer.tasks.process_bulk_queue` (see
+    :class:`invenio_pidrelations.contrib.indexer.RelationsRecordIndexer`).
+
+    :param version_type: Elasticsearch version type.
+    """
+    # NOTE: Invenio-Indexer is optional, while this module is always loaded
+    # by Invenio-Celery.
+    from .contrib.indexer import RelationsRecordIndexer
+    RelationsRecordIndexer(version_type=version_type).process_bulk_queue()
+
+
+@shared_task(ignore_result=True)
+def index_queued_siblings(concept_id):
+    """Bulk index the sibling records queued for a concept.
+
+    :param concept_id: Id of the parent PID of the concept.
+    """
+    queue = current_pidrelations.siblings_index_queue
+    if queue is None:
+        return
+    record_ids = queue.pop(concept_id)
+    if record_ids:
+        from invenio_indexer.api import RecordIndexer
+        RecordIndexer().bulk_index(record_ids)
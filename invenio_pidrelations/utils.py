@@ -27,9 +27,10 @@
 from __future__ import absolute_import, print_function
 
 import six
-from flask import current_app
 from werkzeug.utils import import_string
 
+from .proxies import current_pidrelations
+
 
 def obj_or_import_string(value, default=None):
     """Import string or return object.
@@ -51,22 +52,4 @@ def resolve_relation_type_config(value):
     Resolve relation type from string (e.g.:  serialization) or int (db value)
     to the full config object.
     """
-    relation_types = current_app.config['PIDRELATIONS_RELATION_TYPES']
-    if isinstance(value, six.string_types):
-        try:
-            obj = next(rt for rt in relation_types if rt.name == value)
-        except StopIteration as e:
-            raise ValueError("Relation name '{0}' is not configured.".format(
-                value))
-
-    elif isinstance(value, int):
-        try:
-            obj = next(rt for rt in relation_types if rt.id == value)
-        except StopIteration as e:
-            raise ValueError("Relation ID {0} is not configured.".format(
-                value))
-    else:
-        raise ValueError("Type of value '{0}' is not supported for resolving.")
-    api_class = obj_or_import_string(obj.api)
-    schema_class = obj_or_import_string(obj.schema)
-    return obj.__class__(obj.id, obj.name, obj.label, api_class, schema_class)
+    return current_pidrelations.resolve_relation_type(value)
@@ -34,6 +34,7 @@ history = open('CHANGES.rst').read()
 tests_require = [
     'check-manifest>=0.25',
     'coverage>=4.0',
+    'Flask-CeleryExt>=0.2.2',
     'isort>=4.2.2',
     'pydocstyle>=1.0.0',
     'pytest-cache>=1.0',
@@ -107,12 +108,21 @@ setup(
     include_package_data=True,
     platforms='any',
     entry_points={
+        'flask.commands': [
+            'pidrelations = invenio_pidrelations.cli:pidrelations',
+        ],
         'invenio_base.apps': [
             'invenio_pidrelations = invenio_pidrelations:InvenioPIDRelations',
         ],
         'invenio_base.api_apps': [
             'invenio_pidrelations = invenio_pidrelations:InvenioPIDRelations',
         ],
+        'invenio_celery.tasks': [
+            'invenio_pidrelations = invenio_pidrelations.tasks',
+        ],
+        'invenio_db.alembic': [
+            'invenio_pidrelations = invenio_pidrelations:alembic',
+        ],
         'invenio_db.models': [
             'invenio_pidrelations = invenio_pidrelations.models',
         ],
@@ -29,6 +29,8 @@ from __future__ import absolute_import, print_function
 import os
 import shutil
 import tempfile
+import uuid
+from contextlib import contextmanager
 
 import pytest
 from flask import Flask
@@ -42,9 +44,11 @@ from invenio_pidstore.models import PersistentIdentifier, PIDStatus
 from invenio_records import InvenioRecords, Record
 from invenio_search import InvenioSearch, current_search, current_search_client
 from marshmallow import fields
+from sqlalchemy import event
 from sqlalchemy_utils.functions import create_database, database_exists
 
 from invenio_pidrelations import InvenioPIDRelations
+from invenio_pidrelations.cache import InMemoryBackend
 from invenio_pidrelations.config import RelationType
 from invenio_pidrelations.contrib.versioning import PIDVersioning
 from invenio_pidrelations.models import PIDRelation
@@ -52,6 +56,28 @@ from invenio_pidrelations.serializers.schemas import RelationSchema
 from invenio_pidrelations.utils import resolve_relation_type_config
 
 
+def pytest_addoption(parser):
+    """Add the option to run the benchmarks."""
+    parser.addoption('--benchmarks', action='store_true', default=False,
+                     help='Run the benchmarks.')
+
+
+def pytest_configure(config):
+    """Register the benchmark marker."""
+    config.addinivalue_line(
+        'markers', 'benchmark: benchmark, only run with --benchmarks.')
+
+
+def pytest_collection_modifyitems(config, items):
+    """Skip the benchmarks unless they were requested."""
+    if config.getoption('--benchmarks'):
+        return
+    skip = pytest.mark.skip(reason='Benchmarks only run with --benchmarks.')
+    for item in items:
+        if 'benchmark' in item.keywords:
+            item.add_marker(skip)
+
+
 @pytest.yield_fixture()
 def instance_path():
     """Temporary instance path."""
@@ -81,6 +107,14 @@ def base_app(instance_path):
     return app_
 
 
+@pytest.fixture()
+def relations_cache(base_app):
+    """In-memory backend of the relations cache."""
+    backend = InMemoryBackend()
+    base_app.config['PIDRELATIONS_CACHE_BACKEND'] = backend
+    return backend
+
+
 @pytest.yield_fixture()
 def app(base_app):
     """Flask application fixture."""
@@ -287,8 +321,10 @@ def custom_relation_schema(app):
                      'invenio_pidrelations.contrib.versioning:PIDVersioning',
                      CustomRelationSchema),
     ]
+    app.extensions['invenio-pidrelations'].load_relation_types()
     yield app
     app.config['PIDRELATIONS_RELATION_TYPES'] = orig
+    app.extensions['invenio-pidrelations'].load_relation_types()
 
 
 @pytest.fixture()
@@ -307,6 +343,58 @@ def version_pids(app, db):
     }
 
 
+@pytest.fixture()
+def create_versions(db):
+    """Create versioning concepts with a factory.
+
+    ``create_versions(count, inserted=None, draft=False)`` creates ``count``
+    registered PIDs of records, makes the first one a version of a new
+    ``foobar`` parent and inserts the next ``inserted`` ones (by default all)
+    as versions. A draft version is also inserted if ``draft`` is True. It
+    returns the versioning API of the first version and the created PIDs.
+    """
+    def create(count, inserted=None, draft=False):
+        versions = [PersistentIdentifier.create(
+            'recid', 'foobar.v{}'.format(idx), object_type='rec',
+            object_uuid=uuid.uuid4(), status=PIDStatus.REGISTERED)
+            for idx in range(1, count + 1)]
+        pv = PIDVersioning(child=versions[0])
+        pv.create_parent('foobar')
+        inserted = count - 1 if inserted is None else inserted
+        for version in versions[1:inserted + 1]:
+            pv.insert_child(version)
+        if draft:
+            pv.insert_draft_child(PersistentIdentifier.create(
+                'recid', 'foobar.draft', object_type='rec'))
+        return pv, versions
+    return create
+
+
+@pytest.fixture()
+def captured_statements(db):
+    """Capture the SQL statements executed on the database engine.
+
+    Returns a context manager yielding the list of the ``(statement,
+    parameters)`` pairs executed within it.
+    """
+    @contextmanager
+    def capture():
+        statements = []
+
+        def before_cursor_execute(conn, cursor, statement, parameters,
+                                  context, executemany):
+            statements.append((statement, parameters))
+
+        event.listen(db.engine, 'before_cursor_execute',
+                     before_cursor_execute)
+        try:
+            yield statements
+        finally:
+            event.remove(db.engine, 'before_cursor_execute',
+                         before_cursor_execute)
+    return capture
+
+
 @pytest.fixture()
 def records(pids, db):
     """Fixture for the records."""
@@ -0,0 +1,150 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Benchmarks of the PID relations serialization and queries.
+
+The benchmarks only run with ``--benchmarks``. They check that the compared
+implementations give the same results, and record their timings as test
+properties (e.g. in the JUnit XML report with ``--junitxml``).
+"""
+
+from __future__ import absolute_import, print_function
+
+import timeit
+
+import pytest
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
+
+from invenio_pidrelations.api import PIDConcept
+from invenio_pidrelations.contrib.versioning import PIDVersioning
+from invenio_pidrelations.models import PIDRelation
+from invenio_pidrelations.serializers.schemas import RelationSchema
+from invenio_pidrelations.serializers.utils import dump_relation
+from invenio_pidrelations.utils import resolve_relation_type_config
+
+pytestmark = pytest.mark.benchmark
+
+
+def test_benchmark_relation_serializers(app, db, create_versions,
+                                        record_property):
+    """Benchmark the relation schema against the plain serializer."""
+    pv, versions = create_versions(100)
+    relations = PIDRelation.query.filter_by(parent_id=pv.parent.id).all()
+    concepts = PIDVersioning.bulk_relations(relations)
+
+    def dump_with_schema():
+        result = []
+        for concept in concepts:
+            schema = RelationSchema()
+            schema.context['pid'] = concept.child
+            result.append(schema.dump(concept)[0])
+        return result
+
+    def dump_with_function():
+        return [dump_relation(c, c.child) for c in concepts]
+
+    assert dump_with_function() == dump_with_schema()
+    record_property('schema_time', min(
+        timeit.repeat(dump_with_schema, number=1, repeat=3)))
+    record_property('function_time', min(
+        timeit.repeat(dump_with_function, number=1, repeat=3)))
+
+
+def test_benchmark_children_records(app, db, create_versions,
+                                    record_property):
+    """Benchmark the memory of the read-only records of the children."""
+    tracemalloc = pytest.importorskip('tracemalloc')
+    pv, versions = create_versions(500)
+    parent = pv.parent
+    api = PIDVersioning(parent=parent)
+
+    def load_instances():
+        return [(p.id, p.object_uuid) for p in api.children]
+
+    def load_records():
+        return [(p.id, p.object_uuid) for p in api.children_records]
+
+    def peak_memory(func):
+        db.session.expunge_all()
+        db.session.add(parent)
+        tracemalloc.start()
+        try:
+            result = func()
+            return result, tracemalloc.get_traced_memory()[1]
+        finally:
+            tracemalloc.stop()
+
+    instances, instances_peak = peak_memory(load_instances)
+    records, records_peak = peak_memory(load_records)
+    assert records == instances
+    record_property('instances_peak', instances_peak)
+    record_property('records_peak', records_peak)
+
+
+def create_graph(db, depth, width):
+    """Create a tree of PIDs with given depth and number of children."""
+    ORDERED = resolve_relation_type_config('ordered').id
+    root = PersistentIdentifier.create('recid', 'root', object_type='rec')
+    level, relations, count = [root], [], 0
+    for _ in range(depth):
+        children = []
+        for parent in level:
+            for idx in range(width):
+                count += 1
+                child = PersistentIdentifier(
+                    pid_type='recid', pid_value=str(count),
+                    object_type='rec', status=PIDStatus.REGISTERED)
+                children.append(child)
+                relations.append((parent, child, idx))
+        db.session.add_all(children)
+        db.session.flush()
+        level = children
+    PIDRelation.bulk_create(
+        (parent.id, child.id, ORDERED, idx)
+        for parent, child, idx in relations)
+    return root, count
+
+
+@pytest.mark.parametrize('depth,width', [(200, 1), (3, 12)])
+def test_benchmark_graph_traversal(app, db, record_property, depth, width):
+    """Benchmark the recursive traversal against a walk hop by hop."""
+    root, count = create_graph(db, depth, width)
+
+    def walk():
+        result, level = [], [root]
+        while level:
+            level = [child for parent in level
+                     for child in PIDConcept(parent=parent).children]
+            result.extend(level)
+        return result
+
+    def traverse():
+        return PIDConcept(parent=root).descendants()
+
+    assert sorted(p.id for p in traverse()) == sorted(p.id for p in walk())
+    assert len(traverse()) == count
+    record_property('walk_time', min(
+        timeit.repeat(walk, number=1, repeat=3)))
+    record_property('traverse_time', min(
+        timeit.repeat(traverse, number=1, repeat=3)))
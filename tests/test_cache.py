@@ -0,0 +1,104 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Cache tests."""
+
+from __future__ import absolute_import, print_function
+
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
+
+from invenio_pidrelations.cache import RelationsCache
+from invenio_pidrelations.contrib.versioning import PIDVersioning
+from invenio_pidrelations.serializers.utils import _serialize_relations, \
+    serialize_relations, serialize_relations_many
+
+
+def test_relations_cache(relations_cache, app, db,
+                         nested_pids_and_relations, captured_statements):
+    """Test the shared cache of serialized relations."""
+    pids, _ = nested_pids_and_relations
+    pid = pids[4]
+    backend = relations_cache
+    expected = _serialize_relations(pid)
+
+    assert serialize_relations(pid) == expected
+    with captured_statements() as statements:
+        assert serialize_relations(pid) == expected
+    assert len(statements) == 1
+
+    # Adding a version makes the relations of all the versions stale
+    stamps = RelationsCache(backend).get_stamps([pids[1].id])
+    pid12 = PersistentIdentifier.create('recid', '12', object_type='rec',
+                                        status=PIDStatus.REGISTERED)
+    PIDVersioning(parent=pids[1]).insert_child(pid12)
+    assert RelationsCache(backend).get_stamps([pids[1].id]) != stamps
+    relations = serialize_relations(pid)
+    assert relations['version'][0]['children'][-1]['pid_value'] == '12'
+    assert relations['version'][0]['is_last'] is False
+    assert relations['ordered'] == expected['ordered']
+    assert serialize_relations(pids[2])['version'][0]['children'] == \
+        relations['version'][0]['children']
+
+    # Rolling back makes the relations serialized in between stale
+    db.session.commit()
+    db.session.begin_nested()
+    PIDVersioning(parent=pids[1]).remove_child(pid12)
+    assert serialize_relations(pid)['version'][0]['is_last'] is True
+    db.session.rollback()
+    assert serialize_relations(pid) == relations
+
+
+def test_serialize_relations_many(relations_cache, app, db,
+                                  nested_pids_and_relations,
+                                  captured_statements):
+    """Test serializing the relations of many PIDs at once."""
+    pids, _ = nested_pids_and_relations
+    pids = list(pids.values())
+    expected = dict((p, _serialize_relations(p)) for p in pids)
+    statements = []
+
+    def serialize(pids):
+        db.session.expire_all()
+        assert all(p.id for p in pids)
+        with captured_statements() as captured:
+            result = serialize_relations_many(pids)
+        statements[:] = captured
+        return result
+
+    # Bounded number of queries without the cache
+    app.config['PIDRELATIONS_CACHE_BACKEND'] = None
+    app.extensions['invenio-pidrelations'].__dict__.pop('relations_cache')
+    assert serialize(pids) == expected
+    count = len(statements)
+    assert serialize(pids[:3]) == dict((p, expected[p]) for p in pids[:3])
+    assert len(statements) <= count
+    assert serialize([]) == {}
+
+    # Cached relations are read at once
+    app.config['PIDRELATIONS_CACHE_BACKEND'] = relations_cache
+    app.extensions['invenio-pidrelations'].__dict__.pop('relations_cache')
+    assert serialize(pids) == expected
+    assert serialize(pids) == expected
+    assert len(statements) == 1
+    assert serialize_relations(pids[3]) == expected[pids[3]]
@@ -0,0 +1,81 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""CLI tests."""
+
+from __future__ import absolute_import, print_function
+
+from click.testing import CliRunner
+from flask.cli import ScriptInfo
+
+from invenio_pidrelations.cli import check_closure_table, \
+    rebuild_closure_table, rebuild_heads
+from invenio_pidrelations.models import PIDConceptHead, PIDRelationClosure
+from invenio_pidrelations.utils import resolve_relation_type_config
+
+
+def test_rebuild_heads(app, db, pids):
+    """Test the rebuilding of the concept heads."""
+    runner = CliRunner()
+    script_info = ScriptInfo(create_app=lambda info: app)
+    ORDERED = resolve_relation_type_config('ordered').id
+    ids = {name: pid.id for name, pid in pids.items()}
+    assert PIDConceptHead.query.count() == 0
+
+    result = runner.invoke(rebuild_heads, ['-t', 'version'], obj=script_info)
+    assert result.exit_code == 0
+    assert PIDConceptHead.query.count() == 0
+
+    result = runner.invoke(rebuild_heads, [], obj=script_info)
+    assert result.exit_code == 0
+    heads = {h.parent_id: h for h in PIDConceptHead.query}
+    assert heads[ids['h1']].relation_type == ORDERED
+    assert heads[ids['h1']].last_child_id == ids['h1v3']
+    assert heads[ids['h1']].children_count == 3
+    assert heads[ids['h2']].last_child_id == ids['h2v1']
+    assert heads[ids['c1']].last_child_id is None
+    assert heads[ids['c1']].children_count == 2
+
+
+def test_rebuild_closure(app, db, pids):
+    """Test the rebuilding and checking of the closure table."""
+    runner = CliRunner()
+    script_info = ScriptInfo(create_app=lambda info: app)
+    app.config['PIDRELATIONS_CLOSURE_RELATION_TYPES'] = ['ordered']
+    assert PIDRelationClosure.query.count() == 0
+
+    result = runner.invoke(
+        rebuild_closure_table, ['-t', 'ordered'], obj=script_info)
+    assert result.exit_code == 0
+    assert PIDRelationClosure.query.count() == 4
+
+    result = runner.invoke(check_closure_table, [], obj=script_info)
+    assert result.exit_code == 0
+    assert 'Closure table is consistent.' in result.output
+
+    PIDRelationClosure.query.delete()
+    db.session.commit()
+    result = runner.invoke(check_closure_table, [], obj=script_info)
+    assert result.exit_code == 1
+    assert 'Closure table is inconsistent.' in result.output
@@ -0,0 +1,210 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Closure table tests."""
+
+from __future__ import absolute_import, print_function
+
+import pytest
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
+
+from invenio_pidrelations.api import PIDConcept, PIDConceptOrdered
+from invenio_pidrelations.closure import RelationCycleError, check_closure, \
+    rebuild_closure
+from invenio_pidrelations.models import PIDRelation, PIDRelationClosure
+from invenio_pidrelations.utils import resolve_relation_type_config
+
+
+def test_closure_table(app, db, nested_pids_and_relations,
+                       captured_statements):
+    """Test the maintenance of the closure table."""
+    pids, _ = nested_pids_and_relations
+    ORDERED = resolve_relation_type_config('ordered').id
+    UNORDERED = resolve_relation_type_config('unordered').id
+    app.config['PIDRELATIONS_CLOSURE_RELATION_TYPES'] = ['ordered']
+
+    def values(result):
+        return [p.pid_value for p in result]
+
+    # Relations created before enabling the closure require a rebuild
+    assert len(check_closure()) == 7
+    rebuild_closure()
+    assert check_closure() == []
+    assert PIDRelationClosure.query.count() == 7
+
+    with captured_statements() as statements:
+        assert values(PIDConcept(parent=pids[5]).descendants(
+            relation_types=[ORDERED])) == ['4', '6', '7', '8', '9']
+        assert values(PIDConcept(child=pids[9]).ancestors(
+            relation_types=[ORDERED])) == ['4', '5']
+        assert PIDConcept(child=pids[9]).is_descendant_of(
+            pids[5], relation_types=[ORDERED])
+        assert not PIDConcept(child=pids[9]).is_descendant_of(
+            pids[6], relation_types=[ORDERED])
+    assert len(statements) == 4
+    assert all('pidrelations_closure' in s and 'RECURSIVE' not in s
+               for s, p in statements)
+    # Other relation types are still traversed recursively
+    assert values(PIDConcept(parent=pids[10]).descendants(
+        relation_types=[UNORDERED])) == ['4', '11']
+
+    # Inserting and removing children updates the closure
+    api = PIDConceptOrdered(parent=pids[9], relation_type=ORDERED)
+    api.insert_child(pids[11], index=-1)
+    api.insert_children([pids[3]], index=0)
+    assert check_closure() == []
+    assert values(PIDConcept(parent=pids[5]).descendants(
+        relation_types=[ORDERED], max_depth=3)) == \
+        ['4', '6', '7', '8', '9', '3', '11']
+    api.remove_child(pids[11])
+    assert check_closure() == []
+
+    # PIDs reached by several paths are counted once per path
+    PIDRelation.create(pids[6], pids[9], ORDERED, 0)
+    assert check_closure() == []
+    assert PIDRelationClosure.query.get(
+        (pids[5].id, pids[3].id, ORDERED, 3)).paths == 2
+    assert values(PIDConcept(parent=pids[5]).descendants(
+        relation_types=[ORDERED])) == ['4', '6', '7', '8', '9', '3']
+    relation = PIDRelation.query.filter_by(
+        parent_id=pids[4].id, child_id=pids[9].id).one()
+    relation.relation_type = UNORDERED
+    db.session.flush()
+    assert check_closure() == []
+    db.session.delete(relation)
+    db.session.flush()
+    assert check_closure() == []
+    assert not PIDConcept(child=pids[3]).is_descendant_of(
+        pids[4], relation_types=[ORDERED])
+
+    # Bulk created relations update the closure
+    PIDRelation.bulk_create([(pids[7].id, pids[2].id, ORDERED, 0)])
+    assert check_closure() == []
+    assert PIDConcept(child=pids[2]).is_descendant_of(
+        pids[5], relation_types=[ORDERED])
+
+    # Cycles are rejected
+    with pytest.raises(RelationCycleError):
+        with db.session.begin_nested():
+            PIDRelation.create(pids[3], pids[5], ORDERED, 0)
+    with pytest.raises(RelationCycleError):
+        with db.session.begin_nested():
+            PIDRelation.bulk_create([(pids[2].id, pids[2].id, ORDERED, 0)])
+    assert check_closure() == []
+
+
+def test_closure_rebuild_cycle(app, db):
+    """Test rebuilding the closure of relations with a cycle."""
+    ORDERED = resolve_relation_type_config('ordered').id
+    p1, p2 = (PersistentIdentifier.create(
+        'recid', str(idx), object_type='rec', status=PIDStatus.REGISTERED)
+        for idx in range(2))
+    app.config['PIDRELATIONS_ACYCLIC_RELATION_TYPES'] = []
+    PIDRelation.create(p1, p2, ORDERED, 0)
+    PIDRelation.create(p2, p1, ORDERED, 0)
+    app.config['PIDRELATIONS_CLOSURE_RELATION_TYPES'] = ['ordered']
+    with pytest.raises(RelationCycleError):
+        rebuild_closure()
+
+
+def test_relation_cycles(app, db, nested_pids_and_relations,
+                         captured_statements):
+    """Test the prevention of cycles in the relations."""
+    pids, _ = nested_pids_and_relations
+    ORDERED = resolve_relation_type_config('ordered').id
+    UNORDERED = resolve_relation_type_config('unordered').id
+    new_pid = PersistentIdentifier.create(
+        'recid', '12', object_type='rec', status=PIDStatus.REGISTERED)
+
+    with captured_statements() as statements:
+        # Leaf children are accepted with a single lookup
+        PIDConceptOrdered(parent=pids[5], relation_type=ORDERED).insert_child(
+            new_pid)
+        assert not any('RECURSIVE' in s for s, p in statements)
+        # Other children require to traverse the ancestors of the parent
+        PIDRelation.create(pids[6], pids[4], ORDERED, 0)
+        assert any('RECURSIVE' in s for s, p in statements)
+
+    for parent, child in ((pids[9], pids[5]), (pids[8], pids[4]),
+                          (pids[4], pids[4])):
+        with pytest.raises(RelationCycleError):
+            with db.session.begin_nested():
+                PIDRelation.create(parent, child, ORDERED, 0)
+    with pytest.raises(RelationCycleError):
+        with db.session.begin_nested():
+            PIDConceptOrdered(
+                parent=pids[9], relation_type=ORDERED).insert_child(pids[6])
+    with pytest.raises(RelationCycleError):
+        with db.session.begin_nested():
+            PIDRelation.bulk_create([(pids[9].id, pids[3].id, ORDERED, 0),
+                                     (pids[3].id, pids[5].id, ORDERED, 0)])
+
+    # The leaf children of a chunk are found with a single query
+    nested = db.session.begin_nested()
+    leaves = [PersistentIdentifier.create('recid', 'leaf{}'.format(idx),
+                                          object_type='rec')
+              for idx in range(5)]
+    with captured_statements() as statements:
+        PIDRelation.bulk_create(
+            (pids[9].id, leaf.id, ORDERED, idx)
+            for idx, leaf in enumerate(leaves))
+    assert len([s for s, p in statements if s.startswith('SELECT') and
+                'pidrelations_concepthead' not in s]) == 2
+    assert not any('RECURSIVE' in s for s, p in statements)
+    # The check can be skipped for relations known to be acyclic
+    PIDRelation.bulk_create([(pids[9].id, pids[5].id, ORDERED, 0)],
+                            check_cycles=False)
+    nested.rollback()
+    # Cycles through several relation types are not prevented
+    PIDRelation.create(pids[9], pids[10], UNORDERED, 0)
+
+    # The closure table is used if it is maintained
+    app.config['PIDRELATIONS_CLOSURE_RELATION_TYPES'] = ['ordered']
+    rebuild_closure()
+    with captured_statements() as statements:
+        with pytest.raises(RelationCycleError):
+            with db.session.begin_nested():
+                PIDRelation.create(pids[9], pids[5], ORDERED, 0)
+    assert not any('RECURSIVE' in s for s, p in statements)
+
+    # Cycles are allowed in the other relation types
+    app.config['PIDRELATIONS_ACYCLIC_RELATION_TYPES'] = ['ordered']
+    PIDRelation.create(pids[11], pids[10], UNORDERED, 0)
+
+
+def test_relation_cycles_custom_types(custom_relation_schema, db):
+    """Test the cycle checks with custom relation types."""
+    app = custom_relation_schema
+    app.config['PIDRELATIONS_CLOSURE_RELATION_TYPES'] = ['record_draft']
+    state = app.extensions['invenio-pidrelations']
+    parent = PersistentIdentifier.create('recid', 'foo', object_type='rec')
+    child = PersistentIdentifier.create('recid', 'bar', object_type='rec')
+    db.session.flush()
+
+    # The unconfigured relation types are ignored, without being imported
+    PIDRelation.create(parent, child, 0, 0)
+    assert not state._resolved
+    with pytest.raises(RelationCycleError):
+        with db.session.begin_nested():
+            PIDRelation.create(child, parent, 0, 0)
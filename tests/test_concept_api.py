@@ -26,7 +26,11 @@
 
 from __future__ import absolute_import, print_function
 
-from invenio_pidrelations.api import PIDConcept
+import pytest
+from invenio_pidstore.models import PersistentIdentifier
+from sqlalchemy import func, select
+
+from invenio_pidrelations.api import PIDConcept, PIDConceptOrdered
 from invenio_pidrelations.models import PIDRelation
 from invenio_pidrelations.utils import resolve_relation_type_config
 
@@ -229,3 +233,243 @@ def test_basic_api_methods(app, db, pids):
     assert h1.child_relations.count() == 2
     assert h1_c[0].child == h1v2
     assert h1_c[0].index == 0
+
+
+def relation_updates(statements):
+    """Get the updates of relations among the captured statements."""
+    return [s for s, p in statements
+            if s.startswith('UPDATE pidrelations_pidrelation')]
+
+
+def test_sparse_ordering(app, db, pids, captured_statements):
+    """Test the concept API with sparse ordering of the children."""
+    h1, h1v1, h1v2, h1v3, pid1, c1r1, c1r2 = \
+        (pids[p] for p in ['h1', 'h1v1', 'h1v2', 'h1v3', 'pid1',
+                           'c1r1', 'c1r2'])
+    ORDERED = resolve_relation_type_config('ordered').id
+    app.config['PIDRELATIONS_INDEX_GAPS'] = {'ordered': 4}
+
+    def concept(child):
+        relation = PIDRelation.query.filter_by(
+            child_id=child.id, relation_type=ORDERED).one()
+        return PIDConceptOrdered(relation=relation)
+
+    def stored_indices():
+        return [r.index for r in h1.child_relations.order_by(
+            PIDRelation.index)]
+
+    # Inserting into the dense indices of the fixture rebalances them once
+    PIDConceptOrdered(parent=h1, relation_type=ORDERED).insert_child(
+        pid1, index=1)
+    assert stored_indices() == [0, 2, 4, 8]
+    assert [h1v1, pid1, h1v2, h1v3] == PIDConceptOrdered(
+        parent=h1, relation_type=ORDERED).children.all()
+
+    # Appending, prepending and inserting only write the new relation
+    with captured_statements() as statements:
+        api = PIDConceptOrdered(parent=h1, relation_type=ORDERED)
+        api.insert_child(c1r1, index=-1)
+        api.insert_child(c1r2, index=0)
+        api.remove_child(pid1, reorder=True)
+        api.insert_child(pid1, index=3)
+    assert relation_updates(statements) == []
+    assert stored_indices() == [-4, 0, 4, 6, 8, 12]
+    assert [c1r2, h1v1, h1v2, pid1, h1v3, c1r1] == PIDConceptOrdered(
+        parent=h1, relation_type=ORDERED).children.all()
+
+    # The API exposes dense indices and neighbours
+    assert [concept(p).index for p in [c1r2, h1v1, h1v2, pid1, h1v3, c1r1]] \
+        == [0, 1, 2, 3, 4, 5]
+    assert concept(pid1).previous == h1v2
+    assert concept(pid1).next == h1v3
+    assert concept(c1r2).previous is None
+    assert concept(c1r1).next is None
+    assert PIDConceptOrdered(parent=h1, relation_type=ORDERED).last_child \
+        == c1r1
+
+    # The unordered children are left out of the stored indices
+    unordered, last, first, middle = (PersistentIdentifier.create(
+        'recid', 'sparse{}'.format(idx), object_type='rec')
+        for idx in range(4))
+    api = PIDConceptOrdered(parent=h1, relation_type=ORDERED)
+    api.insert_child(unordered)
+    api.insert_child(last, index=-1)
+    api.insert_child(first, index=0)
+    api.insert_child(middle, index=2)
+    assert concept(unordered).relation.index is None
+    assert [i for i in stored_indices() if i is not None] == \
+        [-8, -4, -2, 0, 4, 6, 8, 12, 16]
+    api._rebalance_indices()
+    assert concept(unordered).relation.index is None
+    assert concept(middle).relation.index == 8
+
+
+def test_insert_children(app, db, pids, captured_statements):
+    """Test inserting many children at once."""
+    h1, h1v1, h1v2, h1v3, c1, c1r1, c1r2, pid1 = \
+        (pids[p] for p in ['h1', 'h1v1', 'h1v2', 'h1v3', 'c1', 'c1r1',
+                           'c1r2', 'pid1'])
+    ORDERED = resolve_relation_type_config('ordered').id
+
+    def stored_indices():
+        return [r.index for r in h1.child_relations.order_by(
+            PIDRelation.index)]
+
+    api = PIDConceptOrdered(parent=h1, relation_type=ORDERED)
+    with captured_statements() as statements:
+        api.insert_children([pid1, c1r1], index=1)
+    assert len(relation_updates(statements)) == 1
+    # Appending does not renumber the siblings
+    with captured_statements() as statements:
+        api.insert_children(iter([c1r2]))
+    assert relation_updates(statements) == []
+    assert api.children.all() == [h1v1, pid1, c1r1, h1v2, h1v3, c1r2]
+    assert stored_indices() == [0, 1, 2, 3, 4, 5]
+    assert api.last_child == c1r2
+    assert api.children_count == 6
+    with pytest.raises(Exception):
+        api.insert_children([h1v1])
+    assert api.children_count == 6
+
+    # With sparse ordering, the new children are spread in the gap
+    app.config['PIDRELATIONS_INDEX_GAPS'] = {'ordered': 8}
+    api.remove_child(pid1)
+    api.remove_child(c1r1)
+    api.insert_children([pid1, c1r1], index=0)
+    assert stored_indices() == [-16, -8, 0, 3, 4, 5]
+    # Without room left in the gap, all the children are renumbered once
+    api.insert_children([c1], index=4)
+    assert stored_indices() == [0, 8, 16, 24, 32, 40, 48]
+    assert api.children.all() == [pid1, c1r1, h1v1, h1v2, c1, h1v3, c1r2]
+
+
+def test_bulk_concepts(app, db, pids):
+    """Test loading many concepts at once."""
+    ORDERED = resolve_relation_type_config('ordered').id
+    names = ['h1v1', 'h1v2', 'h1v3', 'h2v1', 'pid1']
+
+    def dump(api):
+        return dict(
+            parent=api.parent,
+            children=api.parent and api.children.all(),
+            has_parents=api.has_parents, is_ordered=api.is_ordered,
+            last_child=api.last_child, is_last_child=api.is_last_child,
+            index=api.relation and api.index,
+            next=api.relation and api.next,
+            previous=api.relation and api.previous,
+        )
+
+    expected = []
+    for name in names:
+        api = PIDConceptOrdered(child=pids[name], relation_type=ORDERED)
+        api.relation = PIDRelation.query.filter_by(
+            child_id=pids[name].id, relation_type=ORDERED).one_or_none()
+        expected.append(dump(api))
+
+    concepts = PIDConceptOrdered.bulk([pids[n] for n in names], ORDERED)
+    assert [dump(c) for c in concepts] == expected
+    assert concepts[0].next == pids['h1v2']
+    assert concepts[2].is_last_child is True
+
+    # Writing through a bulk loaded concept drops the prefetched data
+    concepts[0].insert_child(pids['pid1'], index=-1)
+    assert concepts[0].children.all() == [
+        pids['h1v1'], pids['h1v2'], pids['h1v3'], pids['pid1']]
+
+
+def test_children_pagination(app, db, pids):
+    """Test the keyset pagination of the children."""
+    h1, h1v1, h1v2, h1v3, c1, c1r1, c1r2, pid1 = \
+        (pids[p] for p in ['h1', 'h1v1', 'h1v2', 'h1v3', 'c1', 'c1r1',
+                           'c1r2', 'pid1'])
+    ORDERED = resolve_relation_type_config('ordered').id
+    UNORDERED = resolve_relation_type_config('unordered').id
+    api = PIDConceptOrdered(parent=h1, relation_type=ORDERED)
+
+    page = api.children_page(limit=2)
+    assert page.children == [h1v1, h1v2]
+    assert page.after == (1, h1v2.id)
+    page = api.children_page(after=page.after, limit=2)
+    assert page.children == [h1v3]
+    assert page.after is None
+
+    # Children without an index come last
+    PIDRelation.create(h1, pid1, ORDERED, None)
+    assert list(api.iter_children(batch_size=1)) == [h1v1, h1v2, h1v3, pid1]
+    assert list(api.iter_children(batch_size=2)) == [h1v1, h1v2, h1v3, pid1]
+    assert list(PIDConceptOrdered.bulk_parents([h1], ORDERED)[0]
+                .iter_children(batch_size=3)) == [h1v1, h1v2, h1v3, pid1]
+
+    unordered = PIDConcept(parent=c1, relation_type=UNORDERED)
+    expected = sorted([c1r1, c1r2], key=lambda p: p.id)
+    page = unordered.children_page(limit=1)
+    assert page.children == expected[:1]
+    assert page.after == (None, expected[0].id)
+    assert list(unordered.iter_children(batch_size=1)) == expected
+    assert list(PIDConcept(parent=pid1, relation_type=UNORDERED)
+                .iter_children()) == []
+
+
+def test_graph_traversal(app, db, nested_pids_and_relations,
+                         captured_statements):
+    """Test the traversal of nested relations of different types."""
+    pids, _ = nested_pids_and_relations
+    ORDERED = resolve_relation_type_config('ordered').id
+    UNORDERED = resolve_relation_type_config('unordered').id
+
+    def values(result):
+        return [p.pid_value for p in result]
+
+    with captured_statements() as statements:
+        assert values(PIDConcept(child=pids[8]).ancestors()) == \
+            ['4', '1', '5', '10']
+    assert len(statements) == 1
+
+    assert values(PIDConcept(child=pids[8]).ancestors(max_depth=1)) == ['4']
+    assert values(PIDConcept(child=pids[8]).ancestors(
+        relation_types=[ORDERED])) == ['4', '5']
+    assert values(PIDConcept(child=pids[10]).ancestors()) == []
+    assert values(PIDConcept(parent=pids[10]).descendants()) == \
+        ['4', '11', '8', '9']
+    assert values(PIDConcept(parent=pids[10]).descendants(
+        relation_types=[UNORDERED])) == ['4', '11']
+    assert values(PIDConcept(parent=pids[8]).descendants()) == []
+    assert [(r.parent.pid_value, r.child.pid_value) for r in PIDConcept(
+        parent=pids[10]).subgraph()] == \
+        [('10', '4'), ('10', '11'), ('4', '8'), ('4', '9')]
+    assert [(r.parent.pid_value, r.child.pid_value) for r in PIDConcept(
+        parent=pids[10]).subgraph(max_depth=1)] == [('10', '4'), ('10', '11')]
+
+    # Cycles are followed only once
+    PIDRelation.create(pids[9], pids[10], ORDERED, 0)
+    assert values(PIDConcept(parent=pids[10]).descendants()) == \
+        ['4', '11', '8', '9']
+    assert values(PIDConcept(child=pids[8]).ancestors()) == \
+        ['4', '1', '5', '10', '9']
+    assert [(r.parent.pid_value, r.child.pid_value) for r in PIDConcept(
+        parent=pids[10]).subgraph()] == \
+        [('10', '4'), ('10', '11'), ('4', '8'), ('4', '9')]
+
+
+def test_graph_traversal_paths(app, db):
+    """Test that the traversal follows each PID once per depth."""
+    ORDERED = resolve_relation_type_config('ordered').id
+    root = PersistentIdentifier.create('recid', 'root', object_type='rec')
+    level, rows = [root], []
+    for depth in range(10):
+        children = [PersistentIdentifier.create(
+            'recid', '{0}.{1}'.format(depth, idx), object_type='rec')
+            for idx in range(2)]
+        rows.extend((parent.id, child.id, ORDERED, idx)
+                    for parent in level for idx, child in enumerate(children))
+        level = children
+    PIDRelation.bulk_create(rows)
+
+    # 2 ** 10 paths lead to the deepest PIDs, which are reached only once
+    traversal = PIDConcept._traversal(root, False)
+    assert db.session.execute(
+        select([func.count()]).select_from(traversal)).scalar() == 20
+    assert len(PIDConcept(parent=root).descendants()) == 20
+    assert len(PIDConcept(parent=root).descendants(max_depth=3)) == 6
+    assert len(PIDConcept(parent=root).subgraph()) == len(rows)
+    assert PIDConcept(child=level[0]).is_descendant_of(root)
@@ -27,9 +27,13 @@
 from __future__ import absolute_import, print_function
 
 # from invenio_indexer.tasks import process_bulk_queue
+from invenio_indexer.api import RecordIndexer
+from invenio_records import Record
 from invenio_search import current_search_client
 
 from invenio_pidrelations.api import PIDConceptOrdered
+from invenio_pidrelations.contrib.indexer import RelationsRecordIndexer
+from invenio_pidrelations.serializers.utils import serialize_relations
 
 
 def test_indexers(app, indexed_records, pids):
@@ -46,3 +50,59 @@ def test_indexers(app, indexed_records, pids):
             pc_api.parent.pid_value
         assert relations['ordered'][0]['is_last'] == \
             pc_api.is_last_child
+
+
+class Message(object):
+    """Bulk indexing queue message."""
+
+    def __init__(self, payload):
+        """Initialize the message."""
+        self.payload = payload
+        self.acked = False
+
+    def decode(self):
+        """Decode the message."""
+        return self.payload
+
+    def ack(self):
+        """Acknowledge the message."""
+        self.acked = True
+
+    def reject(self):
+        """Reject the message."""
+
+
+def test_prefetched_relations(app, db, nested_pids_and_relations,
+                              captured_statements):
+    """Test bulk indexing with prefetched relations."""
+    pids, _ = nested_pids_and_relations
+    records = {}
+    for idx, pid in pids.items():
+        record = Record.create({'title': 'Record {}'.format(idx)})
+        pid.assign('rec', record.id)
+        records[idx] = record
+    record = Record.create({'title': 'Not related'})
+    record_ids = [str(r.id) for r in records.values()] + [str(record.id)]
+
+    def sources(indexer, chunk_size):
+        app.config['PIDRELATIONS_INDEXER_CHUNK_SIZE'] = chunk_size
+        db.session.expire_all()
+        messages = [Message(dict(id=r, op='index', index=None,
+                                 doc_type=None)) for r in record_ids]
+        with captured_statements() as statements:
+            actions = list(indexer._actionsiter(iter(messages)))
+        assert all(m.acked for m in messages)
+        return [a['_source'] for a in actions], len(statements)
+
+    expected, count = sources(RecordIndexer(), 100)
+    assert expected[3]['relations'] == serialize_relations(pids[4])
+    assert 'relations' not in expected[-1]
+
+    for chunk_size in (100, 5):
+        result, prefetched_count = sources(RelationsRecordIndexer(),
+                                           chunk_size)
+        assert result == expected
+        assert prefetched_count < count
+    # One query per record, plus a few per chunk
+    result, prefetched_count = sources(RelationsRecordIndexer(), 100)
+    assert prefetched_count <= len(record_ids) + 10
@@ -26,9 +26,15 @@
 
 from __future__ import absolute_import, print_function
 
+import pytest
 from flask import Flask
 
 from invenio_pidrelations import InvenioPIDRelations
+from invenio_pidrelations.api import PIDConceptOrdered
+from invenio_pidrelations.config import RelationType
+from invenio_pidrelations.contrib.versioning import PIDVersioning
+from invenio_pidrelations.serializers.schemas import RelationSchema
+from invenio_pidrelations.utils import resolve_relation_type_config
 
 
 def test_version():
@@ -48,3 +54,38 @@ def test_init():
     assert 'invenio-pidrelations' not in app.extensions
     ext.init_app(app)
     assert 'invenio-pidrelations' in app.extensions
+
+
+def test_relation_types_registry():
+    """Test the registry of the configured relation types."""
+    app = Flask('testapp')
+    InvenioPIDRelations(app)
+    state = app.extensions['invenio-pidrelations']
+    assert sorted(state.relation_types_by_id) == [0, 1, 2, 3]
+    assert sorted(state.relation_types_by_name) == [
+        'ordered', 'record_draft', 'unordered', 'version']
+    with pytest.raises(TypeError):
+        state.relation_types_by_id[4] = None
+
+    with app.app_context():
+        ordered = resolve_relation_type_config('ordered')
+        assert ordered == (0, 'ordered', 'Ordered', PIDConceptOrdered,
+                           RelationSchema)
+        assert resolve_relation_type_config(0) is ordered
+        with pytest.raises(ValueError):
+            resolve_relation_type_config('foo')
+        with pytest.raises(ValueError):
+            resolve_relation_type_config(42)
+        with pytest.raises(ValueError):
+            resolve_relation_type_config(None)
+
+    assert state.indexed_relations['recid']['api'] is PIDVersioning
+    assert state.indexed_relations['recid']['field'] == 'version'
+
+    app = Flask('testapp')
+    app.config['PIDRELATIONS_RELATION_TYPES'] = [
+        RelationType(0, 'ordered', 'Ordered', None, None),
+        RelationType(0, 'unordered', 'Unordered', None, None),
+    ]
+    with pytest.raises(ValueError):
+        InvenioPIDRelations(app)
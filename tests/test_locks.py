@@ -0,0 +1,170 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Concept locking tests."""
+
+from __future__ import absolute_import, print_function
+
+import threading
+import time
+
+import pytest
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
+
+from invenio_pidrelations.contrib.versioning import PIDVersioning
+from invenio_pidrelations.locks import ConceptConflictError, \
+    ConceptLockedError, _app_locks, lock_concept
+from invenio_pidrelations.models import PIDConceptHead
+
+
+def create_concept(db, create_versions):
+    """Create and commit a versioning concept with a single version."""
+    pv, versions = create_versions(1)
+    db.session.commit()
+    return pv.parent.id
+
+
+def run_threads(app, count, target):
+    """Run a function in given number of threads, each in an app context."""
+    errors = []
+
+    def run(idx):
+        with app.app_context():
+            try:
+                target(idx)
+            except Exception as e:
+                errors.append(e)
+
+    threads = [threading.Thread(target=run, args=(idx, ))
+               for idx in range(count)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return errors
+
+
+def test_lock_concept(app, db, create_versions):
+    """Test that a concept locked by a transaction cannot be locked again."""
+    if db.engine.name != 'sqlite':
+        raise pytest.skip('Process-local locks are only used on SQLite.')
+    parent_id = create_concept(db, create_versions)
+    app.config['PIDRELATIONS_LOCK_RETRIES'] = 1
+    app.config['PIDRELATIONS_LOCK_RETRY_DELAY'] = 0.01
+
+    parent = PersistentIdentifier.query.get(parent_id)
+    lock_concept(parent)
+    # Locking again in the same transaction does nothing
+    lock_concept(parent)
+
+    def lock(idx):
+        lock_concept(PersistentIdentifier.query.get(parent_id))
+
+    errors = run_threads(app, 1, lock)
+    assert len(errors) == 1
+    assert isinstance(errors[0], ConceptLockedError)
+
+    # The lock is released at the end of the transaction
+    db.session.commit()
+    assert run_threads(app, 1, lock) == []
+    # The locks nobody holds or waits for are dropped
+    del errors[:]
+    assert parent_id not in _app_locks
+
+
+def test_concurrent_insert_child(app, db, create_versions,
+                                 record_property):
+    """Test inserting versions of a concept from many threads at once."""
+    parent_id = create_concept(db, create_versions)
+    threads, versions = 4, 10
+
+    def publish(idx):
+        parent = PersistentIdentifier.query.get(parent_id)
+        pids = [PersistentIdentifier.query.filter_by(
+            pid_value='foobar.t{0}.v{1}'.format(idx, version)).one()
+            for version in range(versions)]
+        db.session.commit()
+        for pid in pids:
+            PIDVersioning(parent=parent).insert_child(pid)
+            db.session.commit()
+
+    for idx in range(threads):
+        for version in range(versions):
+            PersistentIdentifier.create(
+                'recid', 'foobar.t{0}.v{1}'.format(idx, version),
+                object_type='rec', status=PIDStatus.REGISTERED)
+    db.session.commit()
+
+    start = time.time()
+    assert run_threads(app, threads, publish) == []
+    record_property('insert_time', time.time() - start)
+
+    db.session.expire_all()
+    parent = PersistentIdentifier.query.get(parent_id)
+    pv = PIDVersioning(parent=parent)
+    relations = pv.children_records
+    assert len(relations) == threads * versions + 1
+    assert [r.index for r in relations] == list(range(len(relations)))
+    assert pv.last_child.id == relations[-1].id
+    assert pv.children_count == len(relations)
+    assert parent.get_redirect().id == relations[-1].id
+
+
+def test_concept_revision(app, db, create_versions, captured_statements):
+    """Test the detection of concurrent modifications with the revision."""
+    app.config['PIDRELATIONS_LOCK_CONCEPTS'] = False
+    pv, (v1, v2, v3, v4) = create_versions(4, inserted=0)
+    assert pv.revision == 1
+    pv.insert_child(v2)
+    assert pv.revision == 2
+    pv.update_redirect()
+    assert pv.revision == 3
+
+    heads = PIDConceptHead.__table__
+
+    def modify_concurrently():
+        """Bump the revision behind the back of the session."""
+        db.session.execute(heads.update().where(
+            heads.c.parent_id == pv.parent.id).values(
+                revision=heads.c.revision + 1))
+
+    # The stale revision of the session makes the first attempt fail
+    head = pv.head
+    modify_concurrently()
+    with captured_statements() as statements:
+        pv.insert_child(v3)
+    assert len([s for s, p in statements
+                if s.startswith('UPDATE pidrelations_concepthead')]) == 2
+    assert head.revision == 5
+    assert pv.children.all() == [v1, v2, v3]
+    assert pv.last_child == v3
+
+    app.config['PIDRELATIONS_CONFLICT_RETRIES'] = 0
+    head = pv.head
+    modify_concurrently()
+    with pytest.raises(ConceptConflictError):
+        pv.insert_child(v4)
+    db.session.expire_all()
+    assert pv.children.all() == [v1, v2, v3]
+    assert head.revision == 6
@@ -0,0 +1,125 @@
+# -*- coding: utf-8 -*-
+#
+# This file is part of Invenio.
+# Copyright (C) 2017 CERN.
+#
+# Invenio is free software; you can redistribute it
+# and/or modify it under the terms of the GNU General Public License as
+# published by the Free Software Foundation; either version 2 of the
+# License, or (at your option) any later version.
+#
+# Invenio is distributed in the hope that it will be
+# useful, but WITHOUT ANY WARRANTY; without even the implied warranty of
+# MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the GNU
+# General Public License for more details.
+#
+# You should have received a copy of the GNU General Public License
+# along with Invenio; if not, write to the
+# Free Software Foundation, Inc., 59 Temple Place, Suite 330, Boston,
+# MA 02111-1307, USA.
+#
+# In applying this license, CERN does not
+# waive the privileges and immunities granted to it by virtue of its status
+# as an Intergovernmental Organization or submit itself to any jurisdiction.
+
+"""Model tests."""
+
+from __future__ import absolute_import, print_function
+
+import pytest
+from invenio_pidstore.models import PersistentIdentifier, PIDStatus
+
+from invenio_pidrelations.api import PIDConceptOrdered
+from invenio_pidrelations.contrib.versioning import PIDVersioning
+from invenio_pidrelations.models import PIDRelation
+from invenio_pidrelations.utils import resolve_relation_type_config
+
+
+def test_relation_queries_use_indexes(app, db, nested_pids_and_relations,
+                                      captured_statements):
+    """Test that the hot relation queries do not scan the relations table."""
+    if db.engine.name != 'sqlite':
+        raise pytest.skip('Query plans are only checked on SQLite.')
+
+    pids, _ = nested_pids_and_relations
+    ORDERED = resolve_relation_type_config('ordered').id
+    db.session.expire_all()
+    with captured_statements() as statements:
+        child_api = PIDConceptOrdered(child=pids[4], relation_type=ORDERED)
+        child_api.relation = PIDRelation.query.filter_by(
+            child_id=pids[4].id, relation_type=ORDERED).one()
+        child_api.parents.all()
+        child_api.has_parents
+        child_api.next
+        child_api.previous
+        child_api.is_last_child
+        parent_api = PIDConceptOrdered(parent=pids[5], relation_type=ORDERED)
+        parent_api.children.all()
+        parent_api.has_children
+        PIDRelation.get_child_relations(pids[4]).all()
+        PIDRelation.get_parent_relations(pids[4]).all()
+        pv = PIDVersioning(child=pids[2])
+        pv.parent
+        pv.last_child
+        pv.draft_child
+
+    relation_statements = [
+        (s, p) for s, p in statements if 'pidrelations_pidrelation' in s]
+    assert relation_statements
+    for statement, parameters in relation_statements:
+        plan = db.session.connection().execute(
+            'EXPLAIN QUERY PLAN ' + statement, parameters).fetchall()
+        details = ' '.join(row[-1] for row in plan)
+        assert 'SCAN pidrelations_pidrelation' not in details, statement
+        assert 'pidrelations_pidrelation' in details, statement
+
+
+def test_bulk_create(app, db, captured_statements):
+    """Test creating many relations at once."""
+    parent = PersistentIdentifier.create('recid', 'foobar', object_type='rec')
+    children = [PersistentIdentifier.create(
+        'recid', 'foobar.v{}'.format(idx), object_type='rec',
+        status=PIDStatus.REGISTERED) for idx in range(5)]
+    VERSION = resolve_relation_type_config('version').id
+    db.session.flush()
+
+    def rows():
+        for idx, child in enumerate(children):
+            yield parent.id, child.id, VERSION, idx
+
+    with captured_statements() as statements:
+        assert PIDRelation.bulk_create(rows(), chunk_size=2) == 5
+    inserts = [s for s, p in statements if s.startswith('INSERT')]
+    assert len(inserts) == 3
+    assert parent.id in db.session.info['pidrelations_changed']
+    assert PIDVersioning(parent=parent).get_children(
+        ordered=True).all() == children
+    assert [r.index for r in PIDRelation.query.order_by(
+        PIDRelation.index)] == list(range(5))
+    assert PIDRelation.bulk_create(iter([])) == 0
+
+    # The existing head of the parent is updated in place
+    concept = PIDVersioning(parent=parent)
+    concept.update_head()
+    assert concept.head.children_count == 5
+    revision = concept.revision
+    last = PersistentIdentifier.create('recid', 'foobar.v5',
+                                       object_type='rec',
+                                       status=PIDStatus.REGISTERED)
+    db.session.flush()
+    with captured_statements() as statements:
+        PIDRelation.bulk_create([(parent.id, last.id, VERSION, 5)])
+    assert len([s for s, p in statements
+                if s.startswith('DELETE FROM pidrelations_concepthead')]) == 0
+    assert concept.head.children_count == 6
+    assert concept.head.last_child == last
+    assert concept.revision > revision
+
+    other = PersistentIdentifier.create('recid', 'spam', object_type='rec')
+    db.session.flush()
+    with pytest.raises(Exception):
+        PIDRelation.bulk_create([(parent.id, children[0].id, VERSION, 0)])
+    with pytest.raises(Exception):
+        PIDRelation.bulk_create([(other.id, children[0].id, VERSION, 0),
+                                 (other.id, children[0].id, VERSION, 1)])
+    assert PIDRelation.query.filter_by(parent_id=other.id).count() == 0
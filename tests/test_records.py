@@ -27,11 +27,15 @@
 from __future__ import absolute_import, print_function
 
 import pytest
-
+from flask_celeryext import FlaskCeleryExt
+from invenio_indexer.api import RecordIndexer
 from invenio_pidstore.models import PersistentIdentifier
 
-from invenio_pidrelations.contrib.records import RecordDraft
+from invenio_pidrelations.cache import InMemoryBackend
+from invenio_pidrelations.contrib.records import RecordDraft, \
+    index_siblings, queue_index_siblings
 from invenio_pidrelations.models import PIDRelation
+from invenio_pidrelations.tasks import index_queued_siblings
 from invenio_pidrelations.utils import resolve_relation_type_config
 
 
@@ -67,3 +71,80 @@ def test_record_draft(app, db):
     assert 'already is a draft of a recid' in str(excinfo.value)
 
 
+@pytest.mark.parametrize('bulk', [False, True])
+def test_index_siblings(app, db, monkeypatch, create_versions, bulk):
+    """Test sending the sibling records for indexing."""
+    indexed = []
+    monkeypatch.setattr(RecordIndexer, 'index_by_id',
+                        lambda self, record_id: indexed.append([record_id]))
+    monkeypatch.setattr(RecordIndexer, 'bulk_index',
+                        lambda self, record_ids: indexed.append(
+                            list(record_ids)))
+
+    pv, versions = create_versions(4)
+    uuids = [str(v.object_uuid) for v in versions]
+
+    def calls(ids):
+        return [ids] if bulk else [[i] for i in ids]
+
+    index_siblings(versions[3], bulk=bulk)
+    assert indexed == calls(uuids[:3])
+    del indexed[:]
+
+    # Only the previous latest version changed with a new latest version
+    index_siblings(versions[3], only_neighbors=True, bulk=bulk)
+    assert indexed == calls(uuids[2:3])
+    del indexed[:]
+
+    index_siblings(versions[0], only_neighbors=True, bulk=bulk)
+    assert indexed == calls(uuids[1:2])
+    del indexed[:]
+
+    index_siblings(versions[1], only_neighbors=True, bulk=bulk)
+    assert indexed == calls([uuids[0], uuids[2]])
+
+
+def test_siblings_index_queue(app, db, monkeypatch, create_versions):
+    """Test the coalescing queue of siblings to index."""
+    app.config.update(
+        CELERY_TASK_ALWAYS_EAGER=True,
+        CELERY_TASK_EAGER_PROPAGATES=True,
+        PIDRELATIONS_INDEX_QUEUE_BACKEND=InMemoryBackend(),
+        PIDRELATIONS_INDEX_QUEUE_WINDOW=30,
+    )
+    FlaskCeleryExt(app)
+    indexed = []
+    monkeypatch.setattr(RecordIndexer, 'bulk_index',
+                        lambda self, record_ids: indexed.append(
+                            sorted(record_ids)))
+
+    pv, versions = create_versions(4, inserted=0)
+    uuids = [str(v.object_uuid) for v in versions]
+
+    # Eager tasks index the queued siblings right away
+    pv.insert_child(versions[1])
+    queue_index_siblings(versions[1])
+    assert indexed == [uuids[:1]]
+    del indexed[:]
+
+    # Siblings queued during the window are indexed once, by one task
+    scheduled = []
+    monkeypatch.setattr(index_queued_siblings, 'apply_async',
+                        lambda args, countdown: scheduled.append(
+                            (args, countdown)))
+    for v in versions[2:]:
+        pv.insert_child(v)
+        queue_index_siblings(v)
+        queue_index_siblings(v, only_neighbors=True)
+    assert scheduled == [((pv.parent.id, ), 30)]
+    assert indexed == []
+    monkeypatch.undo()
+    monkeypatch.setattr(RecordIndexer, 'bulk_index',
+                        lambda self, record_ids: indexed.append(
+                            sorted(record_ids)))
+    index_queued_siblings.delay(pv.parent.id)
+    assert indexed == [sorted(uuids[:3])]
+
+    # Nothing is left to index
+    index_queued_siblings.delay(pv.parent.id)
+    assert indexed == [sorted(uuids[:3])]
@@ -26,8 +26,11 @@
 
 from marshmallow import Schema
 
-from invenio_pidrelations.serializers.schemas import RelationSchema, PIDRelationsMixin
+from invenio_pidrelations.serializers.schemas import RelationSchema, PIDRelationsMixin, \
+    WindowedRelationSchema
 from invenio_pidrelations.models import PIDRelation
+from invenio_pidrelations.serializers.utils import _serialize_relations, \
+    serialize_relations_many
 
 
 class SampleRecordSchema(Schema, PIDRelationsMixin):
@@ -94,3 +97,49 @@ def test_custom_schema(app, nested_pids_and_relations, custom_relation_schema):
     }
     assert not errors
     assert expected == data
+
+
+def test_dump_relation(app, nested_pids_and_relations):
+    """Test the plain relation serializer against the schema."""
+    pids, exp_relations = nested_pids_and_relations
+    expected = dict((p, _serialize_relations(p)) for p in pids.values())
+
+    orig = app.config['PIDRELATIONS_RELATION_TYPES']
+    app.config['PIDRELATIONS_RELATION_TYPES'] = [
+        rt._replace(
+            schema='invenio_pidrelations.serializers.utils:dump_relation')
+        for rt in orig]
+    app.extensions['invenio-pidrelations'].load_relation_types()
+    try:
+        for pid in pids.values():
+            assert _serialize_relations(pid) == expected[pid]
+        assert serialize_relations_many(pids.values()) == expected
+    finally:
+        app.config['PIDRELATIONS_RELATION_TYPES'] = orig
+        app.extensions['invenio-pidrelations'].load_relation_types()
+
+
+def test_windowed_relation_schema(app, nested_pids_and_relations):
+    """Test the serialization of a window of the children."""
+    pids, exp_relations = nested_pids_and_relations
+    app.config['PIDRELATIONS_CHILDREN_WINDOW_SIZE'] = 0
+    orig = app.config['PIDRELATIONS_RELATION_TYPES']
+    state = app.extensions['invenio-pidrelations']
+    expected = dict(_serialize_relations(pids[3])['version'][0])
+    expected.update({
+        'children': [{'pid_type': 'recid', 'pid_value': '3'}],
+        'first_child': {'pid_type': 'recid', 'pid_value': '2'},
+        'last_child': {'pid_type': 'recid', 'pid_value': '4'},
+        'children_count': 3,
+    })
+    try:
+        for schema in (WindowedRelationSchema,
+                       'invenio_pidrelations.serializers.utils:'
+                       'dump_windowed_relation'):
+            app.config['PIDRELATIONS_RELATION_TYPES'] = [
+                rt._replace(schema=schema) for rt in orig]
+            state.load_relation_types()
+            assert _serialize_relations(pids[3])['version'] == [expected]
+    finally:
+        app.config['PIDRELATIONS_RELATION_TYPES'] = orig
+        state.load_relation_types()
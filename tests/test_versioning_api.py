@@ -26,10 +26,15 @@
 
 from __future__ import absolute_import, print_function
 
+import pytest
 from invenio_pidstore.models import PersistentIdentifier, PIDStatus
 
-from invenio_pidrelations.contrib.versioning import PIDVersioning
-from invenio_pidrelations.models import PIDRelation
+from invenio_pidrelations.api import Neighbourhood, PIDRecord, \
+    rebuild_concept_heads
+from invenio_pidrelations.cache import clear_concept_cache
+from invenio_pidrelations.contrib.versioning import PIDVersioning, \
+    latest_version, pid_version_parent, pid_versions, to_versioning_api
+from invenio_pidrelations.models import PIDConceptHead, PIDRelation
 from invenio_pidrelations.utils import resolve_relation_type_config
 
 
@@ -81,3 +86,305 @@ def test_version_api_edit(app, db, version_pids):
     pv.remove_child(h1v2)
     assert h1.get_redirect() == h1v1
     assert pv.last_child == h1v1
+
+
+def test_version_concept_head(app, db, create_versions,
+                              captured_statements):
+    """Test the denormalized head of a versioning concept."""
+    pv, (v1, v2, v3) = create_versions(3, inserted=1, draft=True)
+    h1 = pv.parent
+    draft = pv.draft_child
+
+    VERSION = resolve_relation_type_config('version').id
+    head = PIDConceptHead.query.get((h1.id, VERSION))
+    assert head.last_child == v2
+    assert head.children_count == 2
+
+    # The head is read with a single primary key lookup
+    db.session.expire_all()
+    pv = PIDVersioning(parent=h1)
+    with captured_statements() as statements:
+        assert pv.last_child == v2
+        assert pv.children_count == 2
+    assert len([s for s, p in statements
+                if 'pidrelations_pidrelation' in s]) == 0
+    assert len([s for s, p in statements
+                if 'pidrelations_concepthead' in s]) == 1
+
+    # Publishing the draft updates the head on redirect
+    pv.remove_draft_child()
+    pv.insert_child(v3)
+    assert PIDVersioning(child=v1).last_child == v3
+    pv.insert_draft_child(draft)
+    draft.register()
+    assert PIDVersioning(child=v1).last_child == v3
+    pv.update_redirect()
+    assert PIDVersioning(child=v1).last_child == draft
+    assert PIDVersioning(child=v1).children_count == 4
+    assert h1.get_redirect() == draft
+
+    pv.remove_child(draft)
+    assert PIDVersioning(child=v1).last_child == v3
+    assert h1.get_redirect() == v3
+
+    # Stale heads are fixed in place by rebuilding them
+    head = PIDConceptHead.query.get((h1.id, VERSION))
+    head.last_child = v1
+    head.children_count = 0
+    revision = head.revision
+    rebuild_concept_heads()
+    head = PIDConceptHead.query.get((h1.id, VERSION))
+    assert head.last_child == v3
+    assert head.children_count == 3
+    assert head.revision > revision
+
+
+def test_version_concept_stale_head(app, db, create_versions):
+    """Test the head of a concept whose relations are created without API."""
+    pv, (v1, v2, v3) = create_versions(3, inserted=1)
+    h1 = pv.parent
+    VERSION = resolve_relation_type_config('version').id
+    revision = pv.revision
+
+    PIDRelation.create(h1, v3, VERSION, 2)
+    pv = PIDVersioning(parent=h1)
+    assert pv.head is None
+    assert pv.last_child == v3
+    assert pv.children_count == 3
+
+    # The head is updated in place once committed
+    db.session.commit()
+    head = PIDConceptHead.query.get((h1.id, VERSION))
+    assert head.last_child == v3
+    assert head.children_count == 3
+    assert pv.revision > revision
+
+
+def test_versioning_load_many(app, db, create_versions,
+                              captured_statements):
+    """Test loading the versioning concepts of many PIDs at once."""
+    pv, versions = create_versions(3, draft=True)
+    unversioned = PersistentIdentifier.create(
+        'recid', 'spam', object_type='rec', status=PIDStatus.REGISTERED)
+    pids = versions + [unversioned]
+
+    def dump(api):
+        return dict(
+            parent=api.parent,
+            children=api.parent and api.children.all(),
+            count=api.parent and api.children.count(),
+            has_children=api.parent and api.has_children,
+            is_child=api.is_child, is_last_child=api.is_last_child,
+            last_child=api.last_child,
+            draft_child=api.parent and api.draft_child,
+            index=api.relation and api.index,
+            next=api.relation and api.next,
+            previous=api.relation and api.previous,
+        )
+
+    expected = [dump(PIDVersioning(child=p)) for p in pids]
+
+    db.session.expire_all()
+    assert all(p.id for p in pids)
+    with captured_statements() as statements:
+        concepts = PIDVersioning.load_many(pids)
+        assert len(statements) == 3
+        assert [dump(c) for c in concepts] == expected
+    assert len(statements) == 3
+
+    assert concepts[-1].parent is None
+    assert concepts[-1].children.all() == []
+    assert PIDVersioning.load_many([]) == []
+
+
+def test_versioning_concept_cache(app, db, create_versions,
+                                  captured_statements):
+    """Test the caching of the versioning concepts in templates."""
+    pv, (v1, v2, v3) = create_versions(3, inserted=1)
+    h1 = pv.parent
+
+    with captured_statements() as statements:
+        for _ in range(3):
+            assert pid_version_parent(v2) == h1
+            assert pid_versions(v2).all() == [v1, v2]
+            assert latest_version(child_pid=v2) == v2
+            assert to_versioning_api(v2).is_last_child
+        # The relation is loaded once, then the children and the head are
+        # read with a single query each.
+        assert len(statements) == 1 + 3 * 3
+        for _ in range(3):
+            assert latest_version(parent_pid=h1) == v2
+            assert to_versioning_api(h1, child=False).children.count() == 2
+        assert len(statements) == 1 + 3 * 3 + 3 * 2
+
+    # Modifying the relations invalidates the cached concepts
+    to_versioning_api(v2).insert_child(v3)
+    assert pid_versions(v2).all() == [v1, v2, v3]
+    assert latest_version(child_pid=v2) == v3
+    assert latest_version(parent_pid=h1) == v3
+    to_versioning_api(h1, child=False).remove_child(v3)
+    assert pid_versions(v2).all() == [v1, v2]
+    assert latest_version(parent_pid=h1) == v2
+
+    # Rolling back the session invalidates the cached concepts
+    db.session.commit()
+    db.session.begin_nested()
+    to_versioning_api(v2).insert_child(v3)
+    assert latest_version(child_pid=v1) == v3
+    db.session.rollback()
+    assert latest_version(child_pid=v1) == v2
+
+
+def test_versioning_lazy_relation(app, db, create_versions,
+                                  captured_statements):
+    """Test the number of queries of the API and of the template filters."""
+    pv, (v1, v2) = create_versions(2)
+    h1 = pv.parent
+    db.session.expire_all()
+    # Reload the expired PIDs
+    v1.id
+    v2.id
+    h1.id
+
+    def count(func):
+        clear_concept_cache()
+        with captured_statements() as statements:
+            func()
+        return len(statements)
+
+    # Creating the API does not query, the relation and the parent are
+    # loaded together on first access and memoized.
+    assert count(lambda: PIDVersioning(child=v2)) == 0
+
+    def relation():
+        pv = PIDVersioning(child=v2)
+        assert pv.relation.index == 1
+        assert pv.parent == h1
+        assert pv.is_child
+        assert pv.index == 1
+    assert count(relation) == 1
+    assert count(lambda: PIDVersioning(child=h1).parent) == 1
+    assert count(lambda: PIDVersioning(parent=h1).relation) == 0
+
+    # The template filters do not load the siblings they do not need
+    assert count(lambda: pid_version_parent(v2)) == 1
+    assert count(lambda: pid_versions(v2).all()) == 2
+    assert count(lambda: latest_version(child_pid=v2)) == 2
+    assert count(lambda: latest_version(parent_pid=h1)) == 1
+    assert count(lambda: to_versioning_api(v2).is_last_child) == 2
+    assert count(lambda: to_versioning_api(h1, child=False).children.all()) \
+        == 1
+
+
+def test_versioning_records(app, db, create_versions):
+    """Test reading the versioning relations as read-only records."""
+    pv, (v1, v2, v3) = create_versions(3, draft=True)
+    draft = pv.draft_child
+    h1 = pv.parent
+
+    def record(pid, index):
+        return PIDRecord(pid.id, pid.pid_type, pid.pid_value, pid.status,
+                         pid.object_uuid, index)
+
+    def check():
+        for api in (PIDVersioning(child=v2),
+                    PIDVersioning.load_many([v2])[0]):
+            assert api.children_records == [
+                record(v1, 0), record(v2, 1), record(v3, 2)]
+            assert [r.id for r in api.get_children_records()] == \
+                [v1.id, v2.id, v3.id, draft.id]
+            assert api.last_child_record == record(v3, 2)
+            assert api.draft_child_record == record(draft, 3)
+            assert api.children_records[0].status == PIDStatus.REGISTERED
+        assert PIDVersioning(child=v2).parent_records == [record(h1, 1)]
+        assert PIDVersioning(child=h1).parent_records == []
+        assert PIDVersioning(child=h1).last_child_record is None
+
+    check()
+    # The records give the positions of the children, not the sparse indices
+    app.config['PIDRELATIONS_INDEX_GAPS'] = {'version': 16}
+    PIDVersioning(parent=h1)._rebalance_indices()
+    assert PIDVersioning(child=v2).relation.index == 16
+    check()
+
+
+def test_versioning_insert_children(app, db, create_versions,
+                                    captured_statements):
+    """Test inserting many versions at once."""
+    pv, versions = create_versions(5, inserted=0)
+    h1 = pv.parent
+
+    with captured_statements() as statements:
+        pv.insert_children(versions[1:])
+    assert len([s for s, p in statements if 'pidstore_redirect' in s and
+                not s.startswith('SELECT')]) == 1
+    assert h1.get_redirect() == versions[-1]
+    assert pv.children.all() == versions
+    assert pv.last_child == versions[-1]
+    with pytest.raises(ValueError):
+        pv.insert_children(versions, index=None)
+
+
+def test_versioning_neighbourhood(app, db, create_versions,
+                                  captured_statements):
+    """Test computing the neighbourhood of the versions at once."""
+    pv, versions = create_versions(4, draft=True)
+    draft = pv.draft_child
+    # A version in the middle which is not registered anymore
+    versions[1].status = PIDStatus.DELETED
+    pids = versions + [draft]
+
+    def expected(api):
+        return Neighbourhood(
+            is_ordered=api.is_ordered, index=api.index,
+            previous=api.previous, next=api.next,
+            is_last=api.children.all()[-1] == api.child,
+            children_count=api.children.count())
+
+    def check():
+        for pid in pids:
+            api = PIDVersioning(child=pid)
+            assert api.parent == pv.parent
+            with captured_statements() as statements:
+                neighbourhood = api.neighbourhood()
+            assert len(statements) == 1
+            assert neighbourhood == expected(api)
+        assert [c.neighbourhood() for c in PIDVersioning.load_many(pids)] \
+            == [PIDVersioning(child=p).neighbourhood() for p in pids]
+
+    check()
+    assert PIDVersioning(child=versions[3]).neighbourhood().is_last
+    assert PIDVersioning(child=versions[0]).neighbourhood().next is None
+
+    app.config['PIDRELATIONS_INDEX_GAPS'] = {'version': 16}
+    PIDVersioning(parent=pv.parent)._rebalance_indices()
+    check()
+    assert PIDVersioning(child=versions[0]).neighbourhood().next \
+        == versions[2]
+    assert PIDVersioning(parent=pv.parent).neighbourhood() is None
+
+
+def test_versioning_children_window(app, db, create_versions):
+    """Test the window of children around a version."""
+    pv, versions = create_versions(7, draft=True)
+    draft = pv.draft_child
+    v1, v2, v3, v4, v5, v6, v7 = versions
+
+    def window(pid, size):
+        result = PIDVersioning(child=pid).children_window(size)
+        prefetched = PIDVersioning.load_many([pid])[0].children_window(size)
+        assert result == prefetched
+        return result
+
+    assert window(v4, 1) == ([v3, v4, v5], v1, v7, 7)
+    assert window(v1, 2) == ([v1, v2, v3], v1, v7, 7)
+    assert window(v7, 0) == ([v7], v1, v7, 7)
+    assert window(v7, 10) == (versions, v1, v7, 7)
+    # Windows of non children are taken at the end
+    assert window(draft, 1) == ([v5, v6, v7], v1, v7, 7)
+    assert PIDVersioning(parent=pv.parent).children_window(1) == \
+        ([v5, v6, v7], v1, v7, 7)
+
+    unversioned = PersistentIdentifier.create('recid', 'spam')
+    assert PIDVersioning(parent=unversioned).children_window(1) == \
+        ([], None, None, 0)